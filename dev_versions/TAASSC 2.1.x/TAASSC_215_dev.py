@@ -30,18 +30,68 @@ version = "2.1.15"
 version_notes = "2.1.15 includes updated documentation, minor bug fixes"
 
 import glob #for finding all filenames in a folder
+import multiprocessing #for processing corpora with multiple worker processes
 import os #for making folders
 from xml.dom import minidom #for pretty printing
 import xml.etree.ElementTree as ET #for xml parsing
 from random import sample #for random samples
 import re #for regulat expressions
-from lexical_diversity import lex_div as ld #for lexical diversity. Should probably upgrade to TAALED
+import hashlib #for parse cache keys
+import numpy as np #for the vectorized rule engine (installed with spacy)
+import collections #for the MATTR window
+import functools #for the lgr_tagger pipeline component
 
 ### spacy
 import spacy #base NLP
-#nlp = spacy.load("en_core_web_sm") #load model
-nlp = spacy.load("en_core_web_trf")  #load model
-nlp.max_length = 1728483 #allow more characters to be processed than default. This allows longer documents to be processed. This may need to be made longer.
+from spacy.tokens import DocBin, Doc, Token #for storing parsed texts, rebuilding Docs from annotation files, and Doc/Token extensions
+from spacy.language import Language #for registering the lgr_tagger pipeline component
+from spacy.vocab import Vocab #for loading stored parses without loading the model
+import time #for timing model loading
+
+#The spacy model is not loaded at import. It is loaded the first time it is needed (see load_nlp()).
+#Settings can be changed with configure_nlp() (or environment variables) before the model is used.
+nlp_config = {
+	"model" : os.environ.get("TAASSC_MODEL","en_core_web_trf"), #model name or path (e.g., "en_core_web_sm" for a faster, less accurate model)
+	"disable" : [x for x in os.environ.get("TAASSC_DISABLE","").split(",") if x != ""], #pipeline components to disable (e.g., ["ner"])
+	"max_length" : int(os.environ.get("TAASSC_MAX_LENGTH","1728483")) #allow more characters to be processed than default. This allows longer documents to be processed. This may need to be made longer.
+	}
+nlp_timing = {"cold_start" : None, "warm_start" : None} #seconds; cold = loading the model from disk, warm = retrieving the already-loaded model
+loaded_nlp = None #loaded spacy pipeline (None until first use)
+
+def configure_nlp(model = None, disable = None, max_length = None):
+	"""Change the model name, disabled components, and/or max_length.
+	Changing the model or the disabled components unloads the current pipeline (it is reloaded on next use).
+	"""
+	global loaded_nlp
+	if model != None and model != nlp_config["model"]:
+		nlp_config["model"] = model
+		loaded_nlp = None
+	if disable != None and list(disable) != nlp_config["disable"]:
+		nlp_config["disable"] = list(disable)
+		loaded_nlp = None
+	if max_length != None:
+		nlp_config["max_length"] = max_length
+		if loaded_nlp != None:
+			loaded_nlp.max_length = max_length
+	return(dict(nlp_config))
+
+def load_nlp():
+	"""Return the spacy pipeline, loading it on first use (timings are stored in nlp_timing).
+	"""
+	global loaded_nlp
+	start = time.perf_counter()
+	if loaded_nlp == None:
+		loaded_nlp = spacy.load(nlp_config["model"], disable = nlp_config["disable"]) #load model
+		loaded_nlp.max_length = nlp_config["max_length"]
+		nlp_timing["cold_start"] = time.perf_counter() - start
+	else:
+		nlp_timing["warm_start"] = time.perf_counter() - start
+	return(loaded_nlp)
+
+def __getattr__(name): #keeps `nlp` available as a module attribute (e.g., lgr.nlp) without loading the model at import
+	if name == "nlp":
+		return(load_nlp())
+	raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
 ######################################################
 
 ### Load lists, etc. #################################
@@ -106,7 +156,7 @@ index_list = open("lists_LGR/LGR_index_list_5-26-20.txt").read().split("\n")
 
 ### Utility Functions ####################
 def ex_tester(input_text): #example tester (for checking Spacy output)
-	spcy_sample = nlp(input_text)
+	spcy_sample = load_nlp()(input_text)
 	sent_number = 1
 	for sent in spcy_sample.sents:
 		print("sent_number" + str(sent_number))
@@ -131,41 +181,120 @@ def prettify(elem):
 	return(reparsed.toprettyxml(indent="    "))
 
 
+class MattrWindow:
+	"""Moving-average type-token ratio (MATTR), calculated as the tokens are added (same results as ld.mattr()).
+	Tokens are added as ids (e.g., integer ids for lemma + pos; see pair_id()); only the counts for the current window are kept, and each add() is O(1).
+	Windows for consecutive parts of a text can be combined with merge() (the first and last window_length ids are kept for this).
+	"""
+	def __init__(self,window_length = 50):
+		self.window_length = window_length
+		self.window = collections.deque() #ids in the current window
+		self.counts = {} #id -> number of times in the current window
+		self.types = 0 #number of different ids in the current window
+		self.n = 0 #number of tokens added
+		self.sum_ttr = 0 #sum of the TTRs of the complete windows
+		self.windows = 0 #number of complete windows
+		self.head = [] #first window_length ids (see merge())
+		self.strings = [] #integer id -> string
+		self.string_numbers = {} #string -> integer id (see string_ids())
+
+	def string_ids(self,strings): #integer id for each string (the same string gets the same id in every Doc that is added to the window)
+		ids = []
+		for x in strings:
+			if x not in self.string_numbers:
+				self.string_numbers[x] = len(self.strings)
+				self.strings.append(x)
+			ids.append(self.string_numbers[x])
+		return(ids)
+
+	def pair_id(self,first,second): #integer id for a pair of strings (e.g., lemma and pos; see vector_wrd_nchar())
+		first_id, second_id = self.string_ids([first,second])
+		return((first_id << 32) | second_id)
+
+	def add(self,x):
+		self.n += 1
+		if self.n <= self.window_length:
+			self.head.append(x)
+		self.window.append(x)
+		if x in self.counts:
+			self.counts[x] += 1
+		else:
+			self.counts[x] = 1
+			self.types += 1
+		if self.n > self.window_length: #drop the id that left the window
+			old = self.window.popleft()
+			if self.counts[old] == 1:
+				del self.counts[old]
+				self.types -= 1
+			else:
+				self.counts[old] -= 1
+		if self.n >= self.window_length:
+			self.sum_ttr += self.types/float(self.window_length)
+			self.windows += 1
+
+	def update(self,ids):
+		for x in ids:
+			self.add(x)
+
+	def value(self):
+		if self.n < self.window_length + 1: #texts that are not longer than the window: TTR
+			if self.n == 0:
+				return(0)
+			return(self.types/self.n)
+		return(self.sum_ttr/self.windows)
+
+	def merge(self,other):
+		"""Adds the ids of another MattrWindow (for the part of the text that follows this one). pair_id() ids are translated to the ids of this window.
+		The result is the same as adding all of the ids to this window (the windows that cross the boundary are counted from the last ids of this
+		window and the first ids of the other one; the sums of the TTRs are added, so the value can differ in the last decimal place).
+		"""
+		if other.window_length != self.window_length:
+			raise ValueError("MATTR windows with different lengths cannot be merged")
+		other_ids = lambda ids: [self.pair_id(other.strings[x >> 32],other.strings[x & 0xffffffff]) for x in ids]
+		other_head = other_ids(other.head)
+		other_window = other_ids(other.window)
+		if self.window_length > 1:
+			boundary = MattrWindow(self.window_length)
+			boundary.update(list(self.window)[-(self.window_length - 1):] + other_head[:self.window_length - 1])
+			self.sum_ttr += boundary.sum_ttr
+			self.windows += boundary.windows
+		self.sum_ttr += other.sum_ttr
+		self.windows += other.windows
+		self.n += other.n
+		self.head = (self.head + other_head)[:self.window_length]
+		self.window = collections.deque((list(self.window) + other_window)[-self.window_length:])
+		self.counts = dict(collections.Counter(self.window))
+		self.types = len(self.counts)
+		return(self)
+
 def wrd_nchar(token,feature_dict): #following B et al 2004	
 	if token.pos_ not in ["PUNCT","SYM","SPACE","X"]:
 		feature_dict["wrd_length"] += len(token.text)
 		feature_dict["nwords"] += 1
 		if token.lemma_ == "-PRON-":
-			lemma = token.text.lower()
+			lemma = token.lower_
 		else:
 			lemma = token.lemma_
-		feature_dict["lemma_text"].append(lemma + "_" + token.pos_)
+		feature_dict["mattr"].add(feature_dict["mattr"].pair_id(lemma,token.pos_)) #lemma_pos id (the strings are not concatenated)
+		if feature_dict["lemma_text"] != None: #only kept if requested (see LGR_Doc_Analysis())
+			feature_dict["lemma_text"].append(lemma + "_" + token.pos_)
 
 
+np_dep_features = {"relcl":"relcl_dep","amod":"amod_dep","det":"det_dep","prep":"prep_dep","poss":"poss_dep","cc":"cc_dep"} #nominal dependent relation -> index
+
 def noun_phrase_complexity(token,feature_dict):
 	if token.pos_ == "NOUN": #only consider common nouns (exclude pronouns and proper nouns); mostly following Kyle 2016; Kyle & Crossley, 2018
 		feature_dict["np"] += 1
-		deps = [child.dep_ for child in token.children]
-		feature_dict["np_deps"] += len(deps)
-		for x in deps:
-			if x == "relcl": 
-				feature_dict["relcl_dep"] += 1
-			if x == "amod": 
-				feature_dict["amod_dep"] += 1
-			if x == "det": 
-				feature_dict["det_dep"] += 1
-			if x == "prep": 
-				feature_dict["prep_dep"] += 1
-			if x == "poss": 
-				feature_dict["poss_dep"] += 1
-			if x == "cc": 
-				feature_dict["cc_dep"] += 1
+		feature_dict["np_deps"] += len(token.children)
+		for x in token.children:
+			if x.dep_ in np_dep_features:
+				feature_dict[np_dep_features[x.dep_]] += 1
 
 def clausal_complexity(token,feature_dict):
 	if token.pos_ == "VERB":
 		if token.dep_ != "aux": #check to make sure that this is a main verb
 			feature_dict["all_clauses"] += 1 #finite and nonfinite clauses. Probably won't use
-			deps = [child.dep_ for child in token.children]
+			deps = token.child_deps
 			if "nsubj" in deps or "nsubjpass" in deps:
 				feature_dict["finite_clause"] += 1
 				if token.dep_ in ["ROOT","conj"]:
@@ -180,67 +309,196 @@ def clausal_complexity(token,feature_dict):
 			else:
 				feature_dict["nonfinite_clause"] += 1 #can use "to_clause" to distinguish
 
-			feature_dict["vp_deps"] += len(deps)
+			feature_dict["vp_deps"] += len(token.children)
 
 ###########################################
-def basic_info(token, token_d): #in the future, consider making this a Python class instead of dictionary
+no_children = ()
+no_child_deps = frozenset()
+
+class TokenView:
+	"""The token attributes used by the rule functions, computed once per token (see doc_views()).
+	Has the same attribute names as a spacy Token (text, lemma_, pos_, tag_, dep_, i, head, children), plus:
+	lower_ and lemma_lower (lowercase text and lemma), child_deps (set of the children's dependency relations),
+	prev/next (the neighboring tokens), and adv_phrase (multiword adverb matches; see mark_adverb_phrases()).
+	"""
+	__slots__ = ["text","lower_","lemma_","lemma_lower","pos_","tag_","dep_","i","head","children","child_deps","prev","next","adv_phrase"]
+
+	def __init__(self,text,lower,lemma,lemma_lower,pos,tag,dep,i):
+		self.text = text
+		self.lower_ = lower
+		self.lemma_ = lemma
+		self.lemma_lower = lemma_lower
+		self.pos_ = pos
+		self.tag_ = tag
+		self.dep_ = dep
+		self.i = i
+		self.head = self
+		self.children = no_children #replaced by a list/set if the token has children (see link_views())
+		self.child_deps = no_child_deps
+		self.prev = None
+		self.next = None
+		self.adv_phrase = None
+
+def link_views(views,heads): #sets head, children, and neighbor attributes. heads = index of each token's head
+	for view, head_i in zip(views,heads):
+		head = views[head_i]
+		view.head = head
+		if head is not view: #the root is its own head (but not its own child)
+			if head.children is no_children:
+				head.children = [view]
+				head.child_deps = set([view.dep_])
+			else:
+				head.children.append(view)
+				head.child_deps.add(view.dep_)
+	for prev, view in zip(views[-1:] + views[:-1],views):
+		view.prev = prev #same as doc[token.i - 1] (i.e., the first token's prev is the last token)
+	for view, next_view in zip(views,views[1:]):
+		view.next = next_view
+	return(views)
+
+def doc_views(doc): #one pass over a spacy Doc. Returns a list of TokenViews (indexed like the Doc)
+	views = [TokenView(token.text,token.text.lower(),token.lemma_,token.lemma_.lower(),token.pos_,token.tag_,token.dep_,token.i) for token in doc]
+	return(link_views(views,[token.head.i for token in doc]))
+
+def basic_info(token, token_d, offset = 0): #used when tagged_text is built with a custom cats_d (see TaggedToken for the default); offset = number of tokens in earlier parts of the text (see LGR_Docs_Analysis())
 	token_d["word"] = token.text
-	token_d["lemma"] = token.lemma_.lower()
+	token_d["lemma"] = token.lemma_lower
 	token_d["pos"] = token.pos_
 	token_d["tag"] = token.tag_
-	token_d["idx"] = str(token.i)
+	token_d["idx"] = str(token.i + offset)
 	token_d["dep_rel"] = token.dep_
 	token_d["head"] = token.head.text
-	token_d["head idx"] = str(token.head.i)
+	token_d["head idx"] = str(token.head.i + offset)
+
+tagged_token_keys = list(cats) + ["word","lemma","pos","tag","idx","dep_rel","head","head idx"] #same keys (and key order) as the token dictionaries built with cats + basic_info()
+tagged_token_extra = ["main_tag2"] #tags that are not in cats (these are only keys once they are set, like the dictionary keys that semantic_analysis_verb() adds)
+tagged_token_slots = dict([(x,x.replace(" ","_")) for x in tagged_token_keys + tagged_token_extra]) #key -> attribute name
+
+class TaggedToken:
+	"""Compact record for one token in tagged_text (176 bytes, vs. 464 bytes for a dictionary with the same 17 keys; idx/head idx strings are shared within a Doc).
+	Works like the token dictionaries used in earlier versions: token["spec_tag1"], token["head idx"], iteration over the keys, keys()/values()/items(), get(), "in", len(), and == with a dictionary.
+	New keys cannot be added (use to_dict() for a regular dictionary).
+	"""
+	__slots__ = [tagged_token_slots[x] for x in tagged_token_keys + tagged_token_extra]
+
+	def __init__(self,token,index_strings): #token = TokenView; index_strings = str(i) for each token index in the Doc (shared by idx and head idx)
+		self.main_tag = None
+		self.spec_tag1 = None
+		self.spec_tag2 = None
+		self.spec_tag3 = None
+		self.spec_tag4 = None
+		self.spec_tag5 = None
+		self.spec_tag6 = None
+		self.semantic_tag1 = None
+		self.semantic_tag2 = None
+		self.word = token.text
+		self.lemma = token.lemma_lower
+		self.pos = token.pos_
+		self.tag = token.tag_
+		self.idx = index_strings[token.i]
+		self.dep_rel = token.dep_
+		self.head = token.head.text
+		self.head_idx = index_strings[token.head.i]
+		self.main_tag2 = None
+
+	def key_list(self):
+		if self.main_tag2 == None:
+			return(tagged_token_keys)
+		return(tagged_token_keys + ["main_tag2"])
+
+	def __getitem__(self,key): #one dictionary lookup (main_tag2 is only a key once it is set)
+		if key not in tagged_token_slots or (key == "main_tag2" and self.main_tag2 == None):
+			raise KeyError(key)
+		return(getattr(self,tagged_token_slots[key]))
+
+	def __setitem__(self,key,value):
+		if key not in tagged_token_slots:
+			raise KeyError(key)
+		setattr(self,tagged_token_slots[key],value)
+
+	def __contains__(self,key):
+		return(key in tagged_token_slots and (key != "main_tag2" or self.main_tag2 != None))
+
+	def __iter__(self):
+		return(iter(self.key_list()))
+
+	def __len__(self):
+		return(len(self.key_list()))
+
+	def __eq__(self,other):
+		if isinstance(other,(TaggedToken,dict)):
+			return(self.to_dict() == dict(other.items()))
+		return(NotImplemented)
+
+	__hash__ = None #mutable (like a dictionary)
+
+	def __repr__(self):
+		return(repr(self.to_dict()))
+
+	def get(self,key,default = None):
+		if key not in self:
+			return(default)
+		return(getattr(self,tagged_token_slots[key]))
+
+	def keys(self):
+		return(list(self.key_list()))
+
+	def values(self):
+		return([getattr(self,tagged_token_slots[x]) for x in self.key_list()])
+
+	def items(self):
+		return([(x,getattr(self,tagged_token_slots[x])) for x in self.key_list()])
+
+	def to_dict(self):
+		return(dict(self.items()))
 	
 ### Linguistic Analysis Functions ###
-def pronoun_analysis(token,token_d,feature_dict): #takes spaCY token object and feature_dict as arguments
+#word lists used by the rule functions are defined once (as sets) instead of on every function call
+pp1_set = set("i we our us my me ourselves myself".split(" "))
+pp2_set = set("you your yourself ya thy thee thine".split(" "))
+pp3_set = set("he she they their his them her him themselves himself herself".split(" ")) #no "it" following Biber et al., 2004
+pp3_it_set = set(["it"])
+pp_all_set = pp1_set | pp2_set | pp3_set | pp3_it_set
+
+def pronoun_analysis(token,token_d,feature_dict): #takes TokenView object and feature_dict as arguments
 	#NOTE: Spacy tags "our" and "my" as determiners - run with out tags
-
-	pp1 = "i we our us my me ourselves myself".split(" ") #this makes the string a list
-	pp2 = "you your yourself ya thy thee thine".split(" ")
-	pp3 = "he she they their his them her him themselves himself herself".split(" ") #no "it" following Biber et al., 2004
-	pp3_it = ["it"]
-	
-	pp_all = pp1+pp2+pp3+pp3_it
-	
-	if token.text.lower() in pp_all:
+	lower = token.lower_
+	if lower in pp_all_set:
 		feature_dict["pp_all"] += 1 #add one to feature dict (this is external to the function)
 		token_d["main_tag"] = "pp_all"
 
-	if token.text.lower() in pp1:
+	if lower in pp1_set:
 		feature_dict["pp1"] += 1 #add one to feature dict (this is external to the function)
 		token_d["spec_tag1"] = "pp1"
 		
-	elif token.text.lower() in pp2:
+	elif lower in pp2_set:
 		feature_dict["pp2"] += 1
 		token_d["spec_tag1"] = "pp2"
 		
-	elif token.text.lower() in pp3:
+	elif lower in pp3_set:
 		feature_dict["pp3"] += 1
 		token_d["spec_tag1"] = "pp3"
 		
-	elif token.text.lower() in pp3_it:
+	elif lower in pp3_it_set:
 		feature_dict["pp3_it"] += 1
 		token_d["spec_tag1"] = "pp3_it"
 
+demonstrative_set = set(["this","that","these","those"])
+indefinite_set = set("everybody everyone everything somebody someone something anybody anyone anything nobody noone none nothing one ones".split(" "))
+#note that "one" captures "no one"
+#indefinite list from Longman grammar pp. 352-355
+
 def advanced_pronoun(token,doc,token_d,feature_dict):	#updated 5-8-2020
-	demonstrative_list = ["this","that","these","those"]
-	
-	indefinite_l = "everybody everyone everything somebody someone something anybody anyone anything nobody noone none nothing one ones".split(" ")
-	#note that "one" captures "no one"
-	#indefinite list from Longman grammar pp. 352-355
-	
-	if token.text.lower() in indefinite_l and token.dep_ in ["nsubj","nsubjpass","dobj","pobj"]:
+	if token.lower_ in indefinite_set and token.dep_ in ["nsubj","nsubjpass","dobj","pobj"]:
 		feature_dict["pp_indefinite"] += 1
 		token_d["spec_tag1"] = "pp_indefinite"
 
-	elif token.text.lower() in demonstrative_list: 
+	elif token.lower_ in demonstrative_set: 
 		if token.dep_ == "advmod":
 			feature_dict["pp_demonstrative"] += 1
 			token_d["spec_tag1"] = "pp_demonstrative"
 
-		elif token.i + 1 < len(doc) and doc[token.i + 1].text.lower() in ["who",".","!","?",":"]:
+		elif token.next != None and token.next.lower_ in ["who",".","!","?",":"]:
 			feature_dict["pp_demonstrative"] += 1
 			token_d["spec_tag1"] = "pp_demonstrative"
 		
@@ -262,15 +520,16 @@ def pro_verb(token,token_d,feature_dict):
 	transitive = False
 	
 	if token.lemma_ == "do" and token.pos_ == "VERB" and token.dep_ != "aux":
-		for x in token.children:
-			if x.dep_ in ["dobj","ccomp"]: #if do is transitive:
-				transitive = True
+		if "dobj" in token.child_deps or "ccomp" in token.child_deps: #if do is transitive:
+			transitive = True
 		if transitive == False: #if it isn't transitive, then it is a pro-verb
 			feature_dict["pv_do"] += 1
 			token_d["spec_tag2"] = "pv_do"
 
+contraction_set = set("'m 'll n't 're 's".split(" "))
+
 def contraction_check(token,token_d,feature_dict):	
-	if token.text.lower() in "'m 'll n't 're 's".split(" ") and token.dep_ != "case":
+	if token.lower_ in contraction_set and token.dep_ != "case":
 		feature_dict["contraction"] += 1
 		token_d["spec_tag4"] = "contraction"
 
@@ -295,15 +554,15 @@ def split_aux_check(token,token_d,feature_dict): #takes a verb as input and chec
 	
 def prep_analysis(token,token_d,feature_dict):	
 	if token.dep_ == "mark":
-		if token.text.lower() == "because": # NOTE: this list is likely incomplete
+		if token.lower_ == "because": # NOTE: this list is likely incomplete
 			feature_dict["adverbial_subordinator_causitive"] +=1
 			token_d["spec_tag3"] = "adverbial_subordinator_causitive"
 		
-		elif token.text.lower() in ["if", "unless"]: # # NOTE:this list is likely incomplete
+		elif token.lower_ in ["if", "unless"]: # # NOTE:this list is likely incomplete
 			feature_dict["adverbial_subordinator_conditional"] +=1
 			token_d["spec_tag3"] = "adverbial_subordinator_conditional"
 			
-		elif token.text.lower() not in ["that"]:
+		elif token.lower_ not in ["that"]:
 			feature_dict["adverbial_subordinator_other"] +=1
 			token_d["spec_tag3"] = "adverbial_subordinator_other"
 	
@@ -323,7 +582,7 @@ def prep_analysis(token,token_d,feature_dict):
 
 #this may need to be updated
 def coordination_analysis(token,wrd_count,token_d,feature_dict):
-		if token.text.lower() in ["and", "or"]: #only consider and/or
+		if token.lower_ in ["and", "or"]: #only consider and/or
 			if wrd_count == 0: #capture sentence initial conjunctions as cc_clause
 				feature_dict["cc_clause"] += 1
 				token_d["spec_tag1"] = "cc_clause"
@@ -340,9 +599,9 @@ def coordination_analysis(token,wrd_count,token_d,feature_dict):
 							l.append([child.i,"cc"]) #add cc index to list
 						if child.dep_ == "conj": #narrow down the target of analysis to the second verb(s) by specifying the analysis to coordinated second element
 							
-							if "nsubj" in [chld.dep_ for chld in child.children]: #identify if the second element has "nsubj" tag in its children, if so, this is independent clause coordination
+							if "nsubj" in child.child_deps: #identify if the second element has "nsubj" tag in its children, if so, this is independent clause coordination
 								l.append([child.i,"cc_clause"]) #add index and coordination type to list
-							elif "nsubj" not in [chld.dep_ for chld in child.children]: # if not it is phrasal
+							else: # if not it is phrasal
 								l.append([child.i,"cc_phrase"]) #add index and coordination type to list
 				
 				sort_list = sorted(l,key=lambda x: x[0]) #sort list by index to put in order of appearance
@@ -358,97 +617,111 @@ def coordination_analysis(token,wrd_count,token_d,feature_dict):
 						except IndexError:
 							continue
 
+#nominalization suffixes (note that zero derivation is not included)
+#each list = [suffixes, minimum word length, maximum word length (None = no maximum), PROPN only]
+#word lengths follow the original if/elif cascade: 6-, 5-, and 4-letter suffixes are checked for longer words, but 3- and 2-letter suffixes are only checked for 5- and 4-letter words
+nominal_suffixes = [
+	[["nesses"],8,None,False],
+	[["ician","ities","ances","ences","ments","tions","ships","esses","ettes","hoods"],7,None,False],
+	[["ance","ence","ment","ness","tion","ship","ette","hood","cies","ries","ants","ents","doms","ings","ages","fuls","isms","ists","ites","lets","eses","ates"],6,None,False],
+	[["ians"],6,None,True],
+	[["ant","ent","dom","ing","ity","ure","age","ese","ess","ful","ism","ist","ite","let","als","ees","ers","ors","ate"],5,5,False],
+	[["ian","ans"],5,5,True],
+	[["al","cy","ee","er","or","ry"],4,4,False],
+	[["an"],4,4,True]
+	]
+nominal_stop_set = set(nominal_stop) #stop list comes from list derived from manual analysis of tagged T2KSWAL + TMLE
+
+def suffix_trie(suffix_rules): #reversed-suffix trie: char -> node; each node's None key holds the [minimum length, maximum length, PROPN only] rules that end there
+	trie = {}
+	for suffixes, min_len, max_len, propn_only in suffix_rules:
+		for suffix in suffixes:
+			node = trie
+			for char in reversed(suffix):
+				node = node.setdefault(char,{})
+			node.setdefault(None,[]).append([min_len,max_len,propn_only])
+	return(trie)
+
+nominal_trie = suffix_trie(nominal_suffixes)
+nominal_cache = {} #(lowercase lemma, text, PROPN) -> True/False
+
+def is_nominalization(text,lower,lemma_lower,pos): #text = word form; lower = lowercase word form. Walks the suffix trie once (from the end of the word)
+	key = (lemma_lower,text,pos == "PROPN")
+	if key in nominal_cache:
+		return(nominal_cache[key])
+	result = False
+	if lemma_lower not in nominal_stop_set:
+		length = len(text)
+		node = nominal_trie
+		for char in reversed(lower[-6:]):
+			if char not in node:
+				break
+			node = node[char]
+			for min_len, max_len, propn_only in node.get(None,[]):
+				if length >= min_len and (max_len == None or length <= max_len) and (propn_only == False or pos == "PROPN"):
+					result = True
+			if result == True:
+				break
+	if len(nominal_cache) > 200000: #keep the cache from growing without limit on very large corpora
+		nominal_cache.clear()
+	nominal_cache[key] = result
+	return(result)
+
 def noun_analysis(token,token_d,feature_dict): #revised 5/8/20.
 	if token.pos_ in ["NOUN", "PROPN"]:
 
 		feature_dict["nn_all"] += 1 #add one to the noun count
 		token_d["main_tag"] = "nn_all" #add main tag to attributes
 		
-		two_l = ["al","cy","ee","er","or","ry"]
-		three_l = ["ant","ent","dom","ing","ity","ure","age","ese","ess","ful","ism","ist","ite","let","als","ees","ers","ors","ate"]
-		four_l = ["ance","ence","ment","ness","tion","ship","ette","hood","cies","ries","ants","ents","doms","ings","ages","fuls","isms","ists","ites","lets","eses","ates"]
-		five_l = ["ician","ities","ances","ences","ments","tions","ships","esses","ettes","hoods"]
-		six_l = ["nesses"]
-		
-		proper_two = ["an"]
-		proper_three = ["ian","ans"]
-		proper_four = ["ians"]
-		
-		#note that zero derivation is not included
-		#stop list comes from list derived from manual analysis of tagged T2KSWAL + TMLE 
-		if token.lemma_.lower() not in nominal_stop:
-			#this bit of code could be more elegant...
-			if len(token.text) > 7 and token.text.lower()[-6:] in six_l: #if lemma is longer than 7 characters and has nominalization ending
-				feature_dict["nominalization"] += 1
-				token_d["spec_tag1"] = "nominalization"
-			
-			elif len(token.text) > 6 and token.text.lower()[-5:] in five_l:
-				feature_dict["nominalization"] += 1
-				token_d["spec_tag1"] = "nominalization"
-		
-			elif len(token.text) > 5:
-				if token.text.lower()[-4:] in four_l:
-					feature_dict["nominalization"] += 1
-					token_d["spec_tag1"] = "nominalization"
-				elif token.pos_ == "PROPN" and token.text.lower()[-4:] in proper_four:
-					feature_dict["nominalization"] += 1
-					token_d["spec_tag1"] = "nominalization"
-
-			elif len(token.text) > 4:
-				if token.text.lower()[-3:] in three_l:
-					feature_dict["nominalization"] += 1
-					token_d["spec_tag1"] = "nominalization"
-				elif token.pos_ == "PROPN" and token.text.lower()[-3:] in proper_three:
-					feature_dict["nominalization"] += 1
-					token_d["spec_tag1"] = "nominalization"
-
-			elif len(token.text) > 3:
-				if token.text.lower()[-2:] in two_l:
-					feature_dict["nominalization"] += 1
-					token_d["spec_tag1"] = "nominalization"
-				elif token.pos_ == "PROPN" and token.text.lower()[-2:] in proper_two:
-					feature_dict["nominalization"] += 1
-					token_d["spec_tag1"] = "nominalization"
+		if is_nominalization(token.text,token.lower_,token.lemma_lower,token.pos_): #see nominal_suffixes
+			feature_dict["nominalization"] += 1
+			token_d["spec_tag1"] = "nominalization"
+
+noun_var_set = set("nn_animate nn_cognitive nn_concrete nn_technical nn_quantity nn_place nn_group nn_abstract".split(" "))
 
 def semantic_analysis_noun(token, token_d,feature_dict):
-	var_list = "nn_animate nn_cognitive nn_concrete nn_technical nn_quantity nn_place nn_group nn_abstract".split(" ")
+	var_list = noun_var_set
 
 	if token.pos_ in ["NOUN", "PROPN"]:
  
-		lemma = token.lemma_.lower() #set lemma form of word
+		lemma = token.lemma_lower #set lemma form of word
 		if lemma in noun_dict and noun_dict[lemma] in var_list: #check that word is in dict and category is in var_list
 			feature_dict[noun_dict[lemma]] +=1 #if so, add one to feature_dict
 			token_d["semantic_tag1"] = noun_dict[lemma] #set attribute
 			
 
 def be_analysis(token,token_d,feature_dict):
-	if token.lemma_.lower() == "be" and token.dep_ not in ["aux","auxpass"]:
+	if token.lemma_lower == "be" and token.dep_ not in ["aux","auxpass"]:
 		feature_dict["be_mv"] += 1
 		token_d["spec_tag2"] = "be_mv"
 	
 
-def verb_analysis(token,doc_text,token_d,feature_dict): #need to add spearate tags for tense/aspect and passives
-	that0_list = "check consider ensure illustrate fear say assume understand hold appreciate insist feel reveal indicate wish decide express follow suggest saw direct pray observe record imagine see think show confirm ask meant acknowledge recognize need accept contend come maintain believe claim verify demonstrate learn hope thought reflect deduce prove find deny wrote read repeat remember admit adds advise compute reach trust yield state describe realize expect mean report know stress note told held explain hear gather establish suppose found use fancy submit doubt felt".split(" ")
-	
-	to_verb_list = "to_speech_act_verb cognition_verb desire_verb to_causative_verb probability_verb".split(" ")
-
-	to_adj_list = "certainty_adj ability_willingness_adj personal_affect_adj ease_difficulty_adj evaluative_adj".split(" ")
+that0_set = set("check consider ensure illustrate fear say assume understand hold appreciate insist feel reveal indicate wish decide express follow suggest saw direct pray observe record imagine see think show confirm ask meant acknowledge recognize need accept contend come maintain believe claim verify demonstrate learn hope thought reflect deduce prove find deny wrote read repeat remember admit adds advise compute reach trust yield state describe realize expect mean report know stress note told held explain hear gather establish suppose found use fancy submit doubt felt".split(" "))
+to_verb_set = set("to_speech_act_verb cognition_verb desire_verb to_causative_verb probability_verb".split(" "))
+to_adj_set = set("certainty_adj ability_willingness_adj personal_affect_adj ease_difficulty_adj evaluative_adj".split(" "))
+modal_possibility_set = set("can may might could".split(" "))
+modal_necessity_set = set("ought must should".split(" "))
+modal_predictive_set = set("will would shall".split(" "))
+wh_words = set(["that","who","what","how","where","why","when","whose","whom","whomever"])
+that0_before_stop = wh_words | set(["whatever","which"]) #words before the head verb that rule out a that-omission complement
+that0_after_stop = that0_before_stop | set(['"',"'",",",":","myself","itself","herself","ourself","ourselves","themselves","themself"])
 
+def verb_analysis(token,doc_text,token_d,feature_dict): #need to add spearate tags for tense/aspect and passives
 	if token.pos_ == "VERB":
 		feature_dict["verb"] += 1 #add one to verb count
 		token_d["main_tag"] = "verb"
 		
 		if token.dep_ == "aux": #check for auxilliaries
 			
-			if token.text in "can may might could".split(" "): # if in modal list
+			if token.text in modal_possibility_set: # if in modal list
 				feature_dict["modal_possibility"] += 1
 				token_d["spec_tag5"] = "modal_possibility"
 			
-			elif token.text in "ought must should".split(" "): # if in modal list
+			elif token.text in modal_necessity_set: # if in modal list
 				feature_dict["modal_necessity"] += 1
 				token_d["spec_tag5"] = "modal_necessity"
 		
-			elif token.text in "will would shall".split(" "): # if in modal list
+			elif token.text in modal_predictive_set: # if in modal list
 				feature_dict["modal_predictive"] += 1
 				token_d["spec_tag5"] = "modal_predictive"
 			
@@ -461,60 +734,11 @@ def verb_analysis(token,doc_text,token_d,feature_dict): #need to add spearate ta
 				token_d["spec_tag1"] = "non_past_tense"
 		
 		else: # if not an auxilliary
-			#need to exclude infinitives and reflexive pronouns
-			#need to double check definitions here.
-			if token.head.lemma_ in that0_list and token.dep_ == "ccomp" and token.i > token.head.i:
-				that0_problem = False
-				finite = False
-				aux_be = False
-				vbg_problem = False
-				for x in token.children:
-					if x.text.lower() in ["that","who","what","how","where","why","when","whose","whom","whomever"] and x.dep_ != "det": #this will likely be overly disriminitory
-						that0_problem = True
-					if x.dep_ == "mark":
-						that0_problem = True	
-					if x.dep_ in ["nsubj","csubj"]:
-						finite = True
-					if x.dep_ == "aux" and x.lemma_ == "be":
-						aux_be = True
-				if token.tag_ == "VBG" and aux_be == False:
-					vbg_problem = True
-				if that0_problem == False and doc_text[token.head.i - 1].text not in ["that","who","what","how","where","why","when","whose","whom","whomever","whatever","which"]:
-					if doc_text[token.head.i + 1].text not in ["that","who","what","how","where","why","when","whose","whom","whomever","whatever","which",'"',"'",",",":","myself","itself","herself","ourself","ourselves","themselves","themself"]:
-						if " ".join([doc_text[token.head.i + 1].text,doc_text[token.head.i + 2].text]) not in ["' ,",'" ,'] and "dobj" not in [child.dep_ for child in token.head.children]:
-							if finite == True and vbg_problem == False:
-								feature_dict["complementizer_that0"] += 1 #add one to count
-								token_d["spec_tag6"] = "complementizer_that0"
+			verb_clause_analysis(token,doc_text,token_d,feature_dict) #that-omission and to-clauses
 
 			if token.dep_ == "acl" and token.tag_ == "VBN":
 				feature_dict["past_participial_clause"] += 1 #add one to count
 				token_d["spec_tag6"] = "past_participial_clause"
-			
-			if doc_text[token.i-1].text.lower() == "to" and doc_text[token.i-1].dep_ == "aux" and doc_text[token.i-1].head.i == token.i:
-				contr_token = doc_text[token.i-2]
-				if contr_token.text.lower() not in ["able","ought"]: #spacy wasn't getting all of the phrasal verbs (that tag "to" as "part" instead of "aux") More may need to be added here
-					feature_dict["to_clause"] += 1 #add one to count
-					token_d["spec_tag4"] = "to_clause"
-					
-					if contr_token.pos_ == "NOUN": #consider using head.text instead (previous version used that)
-						feature_dict["to_clause_noun"] += 1 #add one to count
-						token_d["spec_tag5"] = "to_clause_noun"
-					
-					if contr_token.pos_ == "VERB":
-						feature_dict["to_clause_verb"] += 1 #add one to count
-						token_d["spec_tag5"] = "to_clause_verb"
-
-						if contr_token.lemma_ in to_verb_dict and to_verb_dict[contr_token.lemma_] in to_verb_list:
-							feature_dict["to_clause_verb_" + to_verb_dict[contr_token.lemma_][:-5]] += 1
-							token_d["semantic_tag2"] = "to_clause_verb_" + to_verb_dict[contr_token.lemma_][:-5]
-
-					if doc_text[token.i-2].pos_ == "ADJ":
-						feature_dict["to_clause_adjective"] += 1 #add one to count
-						token_d["spec_tag5"] = "to_clause_adjective"
-						
-						if contr_token.lemma_ in adj_dict and adj_dict[contr_token.lemma_] in to_adj_list:
-							feature_dict["to_clause_adjective_" + adj_dict[contr_token.lemma_][:-4]] += 1
-							token_d["semantic_tag2"] = "to_clause_adjective_" + adj_dict[contr_token.lemma_][:-4]
 
 			if token.tag_ == "VBD":
 				feature_dict["past_tense"] += 1 #add one to count
@@ -532,13 +756,62 @@ def verb_analysis(token,doc_text,token_d,feature_dict): #need to add spearate ta
 				feature_dict["non_past_tense"] += 1 #add one to count
 				token_d["spec_tag1"] = "non_past_tense"
 
+def verb_clause_analysis(token,doc_text,token_d,feature_dict): #that-omission and to-clauses (main verbs only; called by verb_analysis())
+	if token.pos_ == "VERB" and token.dep_ != "aux":
+		#need to exclude infinitives and reflexive pronouns
+		#need to double check definitions here.
+		if token.head.lemma_ in that0_set and token.dep_ == "ccomp" and token.i > token.head.i:
+			that0_problem = False
+			finite = False
+			aux_be = False
+			vbg_problem = False
+			for x in token.children:
+				if x.lower_ in wh_words and x.dep_ != "det": #this will likely be overly disriminitory
+					that0_problem = True
+				if x.dep_ == "mark":
+					that0_problem = True	
+				if x.dep_ in ["nsubj","csubj"]:
+					finite = True
+				if x.dep_ == "aux" and x.lemma_ == "be":
+					aux_be = True
+			if token.tag_ == "VBG" and aux_be == False:
+				vbg_problem = True
+			if that0_problem == False and token.head.prev.text not in that0_before_stop:
+				if doc_text[token.head.i + 1].text not in that0_after_stop:
+					if " ".join([doc_text[token.head.i + 1].text,doc_text[token.head.i + 2].text]) not in ["' ,",'" ,'] and "dobj" not in token.head.child_deps:
+						if finite == True and vbg_problem == False:
+							feature_dict["complementizer_that0"] += 1 #add one to count
+							token_d["spec_tag6"] = "complementizer_that0"
+
+		if token.prev.lower_ == "to" and token.prev.dep_ == "aux" and token.prev.head is token:
+			contr_token = token.prev.prev
+			if contr_token.lower_ not in ["able","ought"]: #spacy wasn't getting all of the phrasal verbs (that tag "to" as "part" instead of "aux") More may need to be added here
+				feature_dict["to_clause"] += 1 #add one to count
+				token_d["spec_tag4"] = "to_clause"
+				
+				if contr_token.pos_ == "NOUN": #consider using head.text instead (previous version used that)
+					feature_dict["to_clause_noun"] += 1 #add one to count
+					token_d["spec_tag5"] = "to_clause_noun"
+				
+				if contr_token.pos_ == "VERB":
+					feature_dict["to_clause_verb"] += 1 #add one to count
+					token_d["spec_tag5"] = "to_clause_verb"
+
+					if contr_token.lemma_ in to_verb_dict and to_verb_dict[contr_token.lemma_] in to_verb_set:
+						feature_dict["to_clause_verb_" + to_verb_dict[contr_token.lemma_][:-5]] += 1
+						token_d["semantic_tag2"] = "to_clause_verb_" + to_verb_dict[contr_token.lemma_][:-5]
+
+				if contr_token.pos_ == "ADJ":
+					feature_dict["to_clause_adjective"] += 1 #add one to count
+					token_d["spec_tag5"] = "to_clause_adjective"
+					
+					if contr_token.lemma_ in adj_dict and adj_dict[contr_token.lemma_] in to_adj_set:
+						feature_dict["to_clause_adjective_" + adj_dict[contr_token.lemma_][:-4]] += 1
+						token_d["semantic_tag2"] = "to_clause_adjective_" + adj_dict[contr_token.lemma_][:-4]
+
 def	passive_analysis(token,token_d,feature_dict):
 	if token.pos_ == "VERB":
-		child_list = [] #list for child dependents
-		
-		
-		for x in token.children: #add dependents to the list - annoying, but necessary because of the way spaCy works
-			child_list.append(x.dep_)
+		child_list = token.child_deps #dependency relations of the verb's dependents
 		
 		if "auxpass" in child_list: #check for passives
 			
@@ -550,26 +823,29 @@ def	passive_analysis(token,token_d,feature_dict):
 				feature_dict["agentless_passive"] += 1
 				token_d["spec_tag3"] = "agentless_passive"
 
+#semantic classes counted by semantic_analysis_verb()
+verb_var_set = set("activity_verb communication_verb mental_verb causation_verb occurrence_verb existence_verb aspectual_verb that_nonfactive_verb attitudinal_verb factive_verb likelihood_verb".split(" "))
+intransitive_phrasal_set = set("intransitive_activity_phrasal_verb intransitive_occurence_phrasal_verb copular_phrasal_verb intransitive_aspectual_phrasal_verb".split(" "))
+transitive_phrasal_set = set("transitive_activity_phrasal_verb transitive_mental_phrasal_verb transitive_communication_phrasal_verb".split(" "))
+
 def semantic_analysis_verb(token,token_d,feature_dict):
-	#create three lists:
-	var_list = "activity_verb communication_verb mental_verb causation_verb occurrence_verb existence_verb aspectual_verb that_nonfactive_verb attitudinal_verb factive_verb likelihood_verb".split(" ")
-	intransitive_phrasal_list = "intransitive_activity_phrasal_verb intransitive_occurence_phrasal_verb copular_phrasal_verb intransitive_aspectual_phrasal_verb".split(" ")
-	transitive_phrasal_list = "transitive_activity_phrasal_verb transitive_mental_phrasal_verb transitive_communication_phrasal_verb".split(" ")
+	var_list = verb_var_set
+	intransitive_phrasal_list = intransitive_phrasal_set
+	transitive_phrasal_list = transitive_phrasal_set
 		
-	lemma = token.lemma_.lower() #set lemma form of word
+	lemma = token.lemma_lower #set lemma form of word
 	
 	if token.pos_ == "VERB":
 	
 		#distinguish between non-phrasal, intransitive phrasal and transitive phrasal verbs
-		if "prt" in [chld.dep_ for chld in token.children]: # first, check for phrasal_verbs
+		if "prt" in token.child_deps: # first, check for phrasal_verbs
 			for x in token.children: #then extract particle text
 				if x.dep_ == "prt":
-					phrasal = lemma + " " + x.text #create phrasal verb - will only work with two-word phrasal verbs; could be expanded
-					#print(phrasal)
+					phrasal = phrasal_verb(token,x) #longest matching phrasal verb (or None)
 					if phrasal in phrasal_verb_dict:
 						feature_dict["all_phrasal_verbs"] +=1
 						token_d["main_tag2"] = "all_phrasal_verbs"
-					if "dobj" in [chld.dep_ for chld in token.children]: #check for transitivitivity
+					if "dobj" in token.child_deps: #check for transitivitivity
 						if phrasal in phrasal_verb_dict and phrasal_verb_dict[phrasal] in transitive_phrasal_list:
 							feature_dict[phrasal_verb_dict[phrasal]] +=1 #if so, add one to feature_dict
 							token_d["semantic_tag1"] = phrasal_verb_dict[phrasal] #set attribute
@@ -582,50 +858,146 @@ def semantic_analysis_verb(token,token_d,feature_dict):
 				feature_dict[verb_dict[lemma]] +=1 #if so, add one to feature_dict
 				token_d["semantic_tag1"] = verb_dict[lemma] #set attribute
 
+adj_attr_set = set("size_attributive_adj time_attributive_adj color_attributive_adj evaluative_attributive_adj relational_attributive_adj topical__attributive_adj".split(" "))
+#pred_list = "attitudinal_adj likelihood_adj certainty_adj ability_willingness_adj personal_affect_adj ease_difficulty_adj evaluative_adj".split(" ")
+
 def adjective_analysis(token,token_d,feature_dict):
-	attr_list = "size_attributive_adj time_attributive_adj color_attributive_adj evaluative_attributive_adj relational_attributive_adj topical__attributive_adj".split(" ")
-	#pred_list = "attitudinal_adj likelihood_adj certainty_adj ability_willingness_adj personal_affect_adj ease_difficulty_adj evaluative_adj".split(" ")
-	
 	if token.dep_ in ["acomp"]: #if dep relation is adjective complement, clausal complement, or object predicate (see Biber et al. 1999)
 		feature_dict["jj_predicative"] += 1
 		token_d["spec_tag1"] = "jj_predicative"
-		if token.lemma_.lower() in adj_dict and adj_dict[token.lemma_.lower()] in attr_list:
-			feature_dict[adj_dict[token.lemma_.lower()]] += 1
-			token_d["semantic_tag1"] = adj_dict[token.lemma_.lower()]
+		lemma = token.lemma_lower
+		if lemma in adj_dict and adj_dict[lemma] in adj_attr_set:
+			feature_dict[adj_dict[lemma]] += 1
+			token_d["semantic_tag1"] = adj_dict[lemma]
 		
 	elif token.dep_ == "amod":
 		feature_dict["jj_attributive"] += 1
 		token_d["spec_tag1"] = "jj_attributive"
 		
+adv_var_set = set("discourse_particle place_adverbials time_adverbials conjuncts_adverb downtoners_adverb hedges_adverb amplifiers_adverb emphatics".split(" "))
+adv_var_set2 = set("attitudinal_adverb factive_adverb likelihood_adverb nonfactive_adverb".split(" "))
+discourse_particle_set = set("well now anyway anyhow anyways".split(" ")) #only counted sentence-initially
+
+### Multiword lexicon entries ###
+#Multiword entries (e.g., "kind of", "in fact", "according to") are found with an Aho-Corasick automaton over a stream of words.
+#The automaton is built once, and matching is a single pass over the words (linear in the number of words + matches, regardless of the number of entries)
+def phrase_automaton(phrases): #phrases = iterable of space-separated phrases
+	goto = [{}] #state -> {word : next state}
+	fail = [0] #state -> state for the longest proper suffix that is also a prefix of a phrase
+	out = [[]] #state -> list of (length, phrase) for the phrases that end in this state
+	for phrase in phrases:
+		words = phrase.split(" ")
+		state = 0
+		for word in words:
+			if word not in goto[state]:
+				goto.append({})
+				fail.append(0)
+				out.append([])
+				goto[state][word] = len(goto) - 1
+			state = goto[state][word]
+		out[state].append((len(words),phrase))
+	queue = list(goto[0].values()) #breadth-first, so that fail states are always finished first
+	for state in queue:
+		for word, next_state in goto[state].items():
+			queue.append(next_state)
+			fallback = fail[state]
+			while fallback != 0 and word not in goto[fallback]:
+				fallback = fail[fallback]
+			fail[next_state] = goto[fallback].get(word,0)
+			out[next_state] = out[next_state] + out[fail[next_state]]
+	return({"goto" : goto, "fail" : fail, "out" : out})
+
+def phrase_matches(automaton,words): #yields (start, end, phrase) for each occurrence of a phrase in a list of words (in order of end position)
+	goto = automaton["goto"]
+	fail = automaton["fail"]
+	state = 0
+	for i, word in enumerate(words):
+		while state != 0 and word not in goto[state]:
+			state = fail[state]
+		state = goto[state].get(word,0)
+		for length, phrase in automaton["out"][state]:
+			yield((i + 1 - length,i + 1,phrase))
+
+adverb_phrases = phrase_automaton([x for x in adv_dict if " " in x]) #entries are word forms (e.g., "most cases"), so they are matched against lowercase words instead of lemmas
+adverb_phrase_words = set([x.split(" ")[0] for x in adv_dict if " " in x]) #first word of each multiword entry
+phrasal_verbs = phrase_automaton(phrasal_verb_dict) #verb lemma + particle (+ preposition)
+
+def adverbial_span(span): #True if a multiword adverb entry (list of TokenViews) is used as an adverbial (e.g., "kind of tired" but not "a kind of dog")
+	for view in span:
+		if view.pos_ == "ADV" or view.dep_ in ["npadvmod","advmod", "intj"]:
+			return(True)
+	root = span[0]
+	for view in span: #the token that attaches the span to the rest of the sentence
+		if view.head is view or view.head.i < span[0].i or view.head.i > span[-1].i:
+			root = view
+			break
+	if root.dep_ == "pobj" and root.head.dep_ == "prep": #e.g., "[in] most cases"
+		root = root.head
+	return(root.dep_ == "prep" and root.head.pos_ not in ["NOUN","PROPN","PRON"]) #prepositional phrase that is not attached to a noun (e.g., "in fact", "according to")
+
+def mark_adverb_phrases(views,sent_bounds): #one pass per sentence. sent_bounds = list of (start, end) token indices
+	"""Sets TokenView.adv_phrase to the semantic class for the first token of each multiword adverbial and to False for its other tokens.
+	Overlapping matches are resolved leftmost-longest.
+	"""
+	for start, end in sent_bounds:
+		matches = sorted(phrase_matches(adverb_phrases,[view.lower_ for view in views[start:end]]),key = lambda x: (x[0],x[0] - x[1]))
+		covered = 0 #matches cannot overlap
+		for match_start, match_end, phrase in matches:
+			span = views[start + match_start:start + match_end]
+			if match_start >= covered and adverbial_span(span):
+				span[0].adv_phrase = adv_dict[phrase]
+				for view in span[1:]:
+					view.adv_phrase = False
+				covered = match_end
+
+def phrasal_verb(token,particle): #longest phrasal verb entry for a verb + particle (+ the next preposition), e.g., "give up" (or "put up with" if it is added to the list)
+	words = [token.lemma_lower,particle.lower_]
+	for x in token.children:
+		if x.dep_ == "prep" and x.i > particle.i:
+			words.append(x.lower_)
+			break
+	phrasal = None
+	for start, end, match in phrase_matches(phrasal_verbs,words):
+		if start == 0:
+			phrasal = match #matches are in order of end position, so the last one is the longest
+	return(phrasal)
+
 def adverb_analysis(token, w_count, token_d,feature_dict):
-	var_list = "discourse_particle place_adverbials time_adverbials conjuncts_adverb downtoners_adverb hedges_adverb amplifiers_adverb emphatics".split(" ")
-	var_list2 = "attitudinal_adverb factive_adverb likelihood_adverb nonfactive_adverb".split(" ")
-
-	lemma = token.lemma_.lower()
-	if token.pos_ == "ADV" or token.dep_ in ["npadvmod","advmod", "intj"]:
-		if lemma in adv_dict and adv_dict[lemma] in var_list:
-			feature_dict[adv_dict[lemma]] += 1
-			token_d["spec_tag1"] = adv_dict[lemma]
-		
-		if w_count == 0 and token.text.lower() in "well now anyway anyhow anyways".split(" "):
-			feature_dict["discourse_particle"] += 1
-			token_d["spec_tag1"] = "discourse_particle"
+	var_list = adv_var_set
+	var_list2 = adv_var_set2
+
+	if token.adv_phrase == False: #part of a multiword adverbial that starts at an earlier token (see mark_adverb_phrases())
+		return
+	elif token.adv_phrase != None: #first token of a multiword adverbial
+		adv_class = token.adv_phrase
+	elif token.pos_ == "ADV" or token.dep_ in ["npadvmod","advmod", "intj"]:
+		adv_class = adv_dict.get(token.lemma_lower)
+	else:
+		return
+
+	if adv_class in var_list:
+		feature_dict[adv_class] += 1
+		token_d["spec_tag1"] = adv_class
+	
+	if w_count == 0 and token.lower_ in discourse_particle_set:
+		feature_dict["discourse_particle"] += 1
+		token_d["spec_tag1"] = "discourse_particle"
 
-		elif lemma in adv_dict and adv_dict[lemma] in var_list2:
-			feature_dict[adv_dict[lemma]] += 1
-			token_d["semantic_tag1"] = adv_dict[lemma]
+	elif adv_class in var_list2:
+		feature_dict[adv_class] += 1
+		token_d["semantic_tag1"] = adv_class
 
 def wh_analysis(token,w_count,doc_text,sent_doc,token_d,feature_dict):
 	
-	if token.tag_ in ["WDT","WP", "WP$", "WRB"] and token.text.lower() != "that":
+	if token.tag_ in ["WDT","WP", "WP$", "WRB"] and token.lower_ != "that":
 		
 		if token.head.dep_ not in ["csubj","ccomp", "pcomp"]:
-			if w_count == 0 or doc_text[token.i-1].text in ['"',"'",":"]: #if WH word is first word in sentence or is first word in quote or after colon:		
+			if w_count == 0 or token.prev.text in ['"',"'",":"]: #if WH word is first word in sentence or is first word in quote or after colon:		
 				if "?" in [t.text for t in sent_doc]:
 					feature_dict["wh_question"] += 1
 					token_d["spec_tag1"] = "wh_question"
 			
-		if doc_text[token.i-1].pos_ == "VERB" and doc_text[token.i-1].lemma_ != "be":
+		if token.prev.pos_ == "VERB" and token.prev.lemma_ != "be":
 			if token.head.dep_ != "advcl": #not sure if this is corret or not.
 				feature_dict["wh_clause"] += 1
 				token_d["spec_tag1"] = "wh_clause"
@@ -649,12 +1021,16 @@ def wh_analysis(token,w_count,doc_text,sent_doc,token_d,feature_dict):
 				feature_dict["wh_relative_obj_clause"] += 1
 				token_d["spec_tag1"] = "wh_relative_obj_clause"
 
+that_verb_set = set("nonfactive_verb attitudinal_verb factive_verb likelihood_verb".split(" "))
+that_noun_classes = "nn_nonfactive nn_attitudinal nn_factive_noun nn_likelihood" #note: a string, so semantic classes are checked as substrings
+that_noun_set = set([x for x in noun_dict.values() if x in that_noun_classes]) #noun classes that are counted by that_analysis()
+
 def that_analysis(token,doc_text,token_d,feature_dict):
-	that_verb_list = "nonfactive_verb attitudinal_verb factive_verb likelihood_verb".split(" ")
+	that_verb_list = that_verb_set
 
-	that_noun_list = "nn_nonfactive nn_attitudinal nn_factive_noun nn_likelihood"
+	that_noun_list = that_noun_classes
 
-	if token.text.lower() == "that":
+	if token.lower_ == "that":
 		if token.dep_ in ["nsubj","nsubjpass","dobj","pobj"] and token.head.dep_ == "relcl": #consider adding "mark" to the possible token.dep_ options
 			feature_dict["that_relative_clause"] += 1
 			token_d["spec_tag1"] = "that_relative_clause"
@@ -663,18 +1039,18 @@ def that_analysis(token,doc_text,token_d,feature_dict):
 			feature_dict["that_complement_clause"] += 1
 			token_d["spec_tag1"] = "that_complement_clause"
 		
-			if doc_text[token.i-1].pos_ == "VERB":
+			if token.prev.pos_ == "VERB":
 				feature_dict["that_verb_clause"] += 1
 				token_d["spec_tag2"] = "that_verb_clause"
-				verb_lemma = doc_text[token.i-1].lemma_.lower()
+				verb_lemma = token.prev.lemma_lower
 				if verb_lemma in that_verb_dict and that_verb_dict[verb_lemma] in that_verb_list: #check for semantic class
 					feature_dict["that_verb_clause_" + that_verb_dict[verb_lemma][:-5]] += 1
 					token_d["semantic_tag1"] = "that_verb_clause_" + that_verb_dict[verb_lemma][:-5]
 
-			if doc_text[token.i-1].pos_ == "NOUN":
+			if token.prev.pos_ == "NOUN":
 				feature_dict["that_noun_clause"] += 1
 				token_d["spec_tag2"] = "that_noun_clause"
-				noun_lemma = doc_text[token.i-1].lemma_.lower()
+				noun_lemma = token.prev.lemma_lower
 				#print(noun_lemma)
 				if noun_lemma in noun_dict and noun_dict[noun_lemma] in that_noun_list:
 					#print(noun_lemma,noun_dict[noun_lemma])
@@ -682,10 +1058,10 @@ def that_analysis(token,doc_text,token_d,feature_dict):
 					token_d["semantic_tag1"] = "that_noun_clause_" + noun_dict[noun_lemma][3:]
 
 
-			if doc_text[token.i-1].pos_ == "ADJ":
+			if token.prev.pos_ == "ADJ":
 				feature_dict["that_adjective_clause"] += 1
 				token_d["spec_tag2"] = "that_adjective_clause"
-				adj_lemma = doc_text[token.i-1].lemma_.lower()
+				adj_lemma = token.prev.lemma_lower
 				if adj_lemma in adj_dict:
 					if adj_dict[adj_lemma] == "attitudinal_adj":
 						feature_dict["that_adjective_clause_attitudinal"] +=1
@@ -697,110 +1073,847 @@ def that_analysis(token,doc_text,token_d,feature_dict):
 
 #############################
 
+### Vectorized rule engine ###
+#Rules that only depend on a token's own attributes (or on its head's/children's attributes) are also implemented
+#as NumPy array operations over Doc.to_array() columns. Counts come from np.count_nonzero() and tags are assigned
+#to one array per tag slot. Results are identical to the per-token rule functions (which are still used for the other rules).
+column_attrs = ["ORTH","LEMMA","POS","TAG","DEP","HEAD"]
+
+def column_strings(doc,column): #returns (list of unique strings, index of each token's string in that list)
+	hashes, inverse = np.unique(column,return_inverse = True)
+	return([doc.vocab.strings[int(x)] for x in hashes],inverse)
+
+def doc_columns(doc):
+	"""Exports a Doc to NumPy arrays (one value per token). Returns a dictionary with:
+	"n" (number of tokens), "head" (head index), "nonroot" (token is not its own head), and for each of
+	"text", "lemma", "pos", "tag", "dep": [unique strings, index of each token's string]
+	"""
+	n = len(doc)
+	if n == 0:
+		array = np.zeros((0,len(column_attrs)),dtype = "uint64")
+	else:
+		array = doc.to_array(column_attrs)
+	columns = {"n" : n}
+	for name, col in zip(["text","lemma","pos","tag","dep"],range(5)):
+		columns[name] = column_strings(doc,array[:,col])
+	positions = np.arange(n)
+	columns["head"] = positions + array[:,5].astype("int64") #HEAD is stored as an offset
+	columns["nonroot"] = columns["head"] != positions
+	return(columns)
+
+def column_mask(columns,name,test): #test = set of strings or a function of a string. Returns a boolean array
+	values, inverse = columns[name]
+	if callable(test):
+		matches = np.array([test(x) for x in values],dtype = bool)
+	else:
+		matches = np.array([x in test for x in values],dtype = bool)
+	return(matches[inverse])
+
+def column_values(columns,name,lookup): #lookup = function of a string (returns a string or None). Returns an object array
+	values, inverse = columns[name]
+	return(np.array([lookup(x) for x in values],dtype = object)[inverse])
+
+def column_views(columns): #same as doc_views(), but built from doc_columns() output
+	def token_strings(name,lowercase = False): #each token's string (each unique string is only lowercased once)
+		values, inverse = columns[name]
+		if lowercase == True:
+			values = [x.lower() for x in values]
+		return(np.array(values + [None],dtype = object)[inverse].tolist()) #None makes sure that numpy keeps the strings as objects
+	views = list(map(TokenView,token_strings("text"),token_strings("text",True),token_strings("lemma"),token_strings("lemma",True),token_strings("pos"),token_strings("tag"),token_strings("dep"),range(columns["n"])))
+	return(link_views(views,columns["head"].tolist()))
+
+def child_mask(columns,mask): #True for tokens that have at least one child for which mask is True
+	return(np.bincount(columns["head"][mask & columns["nonroot"]],minlength = columns["n"]) > 0)
+
+def child_count(columns,mask = None): #number of children (for which mask is True)
+	if mask is None:
+		mask = columns["nonroot"]
+	else:
+		mask = mask & columns["nonroot"]
+	return(np.bincount(columns["head"][mask],minlength = columns["n"]))
+
+def empty_tags(columns):
+	return(np.full(columns["n"],None,dtype = object))
+
+def count_mask(feature_dict,index,mask): #adds the number of True values to an index
+	feature_dict[index] += int(np.count_nonzero(mask)) #python int (not np.int64), like the python engine
+
+def count_values(feature_dict,values): #adds one to each index in an object array
+	names, counts = np.unique(values.astype(str),return_counts = True)
+	for name, count in zip(names,counts):
+		feature_dict[name] += int(count)
+
+def vector_pronoun_analysis(columns,feature_dict): #see pronoun_analysis()
+	main_tag = empty_tags(columns)
+	spec_tag1 = empty_tags(columns)
+	mask = column_mask(columns,"text",lambda x: x.lower() in pp_all_set)
+	count_mask(feature_dict,"pp_all",mask)
+	main_tag[mask] = "pp_all"
+	for name, word_set in [["pp1",pp1_set],["pp2",pp2_set],["pp3",pp3_set],["pp3_it",pp3_it_set]]:
+		mask = column_mask(columns,"text",lambda x: x.lower() in word_set)
+		count_mask(feature_dict,name,mask)
+		spec_tag1[mask] = name
+	return([["main_tag",main_tag],["spec_tag1",spec_tag1]])
+
+def vector_contraction_check(columns,feature_dict): #see contraction_check()
+	spec_tag4 = empty_tags(columns)
+	mask = column_mask(columns,"text",lambda x: x.lower() in contraction_set) & ~column_mask(columns,"dep",["case"])
+	count_mask(feature_dict,"contraction",mask)
+	spec_tag4[mask] = "contraction"
+	return([["spec_tag4",spec_tag4]])
+
+def vector_be_analysis(columns,feature_dict): #see be_analysis()
+	spec_tag2 = empty_tags(columns)
+	mask = column_mask(columns,"lemma",lambda x: x.lower() == "be") & ~column_mask(columns,"dep",["aux","auxpass"])
+	count_mask(feature_dict,"be_mv",mask)
+	spec_tag2[mask] = "be_mv"
+	return([["spec_tag2",spec_tag2]])
+
+def vector_verb_analysis(columns,feature_dict): #see verb_analysis() (verb_clause_analysis() is run separately)
+	main_tag = empty_tags(columns)
+	spec_tag1 = empty_tags(columns)
+	spec_tag4 = empty_tags(columns)
+	spec_tag5 = empty_tags(columns)
+	spec_tag6 = empty_tags(columns)
+	verb = column_mask(columns,"pos",["VERB"])
+	count_mask(feature_dict,"verb",verb)
+	main_tag[verb] = "verb"
+
+	aux = verb & column_mask(columns,"dep",["aux"])
+	remaining = aux.copy() #auxilliaries that have not been classified yet
+	for name, word_set in [["modal_possibility",modal_possibility_set],["modal_necessity",modal_necessity_set],["modal_predictive",modal_predictive_set]]:
+		mask = remaining & column_mask(columns,"text",word_set)
+		count_mask(feature_dict,name,mask)
+		spec_tag5[mask] = name
+		remaining &= ~mask
+	vbd = column_mask(columns,"tag",["VBD"])
+	mask = remaining & vbd
+	count_mask(feature_dict,"past_tense",mask)
+	spec_tag4[mask] = "past_tense"
+	mask = remaining & ~vbd
+	count_mask(feature_dict,"non_past_tense",mask)
+	spec_tag1[mask] = "non_past_tense"
+
+	main = verb & ~aux
+	mask = main & column_mask(columns,"dep",["acl"]) & column_mask(columns,"tag",["VBN"])
+	count_mask(feature_dict,"past_participial_clause",mask)
+	spec_tag6[mask] = "past_participial_clause"
+	mask = main & vbd
+	count_mask(feature_dict,"past_tense",mask)
+	spec_tag1[mask] = "past_tense"
+	participle = main & column_mask(columns,"tag",["VBN","VBG"])
+	mask = participle & child_mask(columns,column_mask(columns,"lemma",["have"]) & column_mask(columns,"dep",["aux"]))
+	count_mask(feature_dict,"perfect_aspect",mask)
+	spec_tag1[mask] = "perfect_aspect"
+	mask = main & ~vbd & ~participle
+	count_mask(feature_dict,"non_past_tense",mask)
+	spec_tag1[mask] = "non_past_tense"
+	return([["main_tag",main_tag],["spec_tag5",spec_tag5],["spec_tag4",spec_tag4],["spec_tag1",spec_tag1],["spec_tag6",spec_tag6]])
+
+def vector_passive_analysis(columns,feature_dict): #see passive_analysis()
+	spec_tag3 = empty_tags(columns)
+	passive = column_mask(columns,"pos",["VERB"]) & child_mask(columns,column_mask(columns,"dep",["auxpass"]))
+	agent = child_mask(columns,column_mask(columns,"dep",["agent"]))
+	count_mask(feature_dict,"by_passive",passive & agent)
+	spec_tag3[passive & agent] = "by_passive"
+	count_mask(feature_dict,"agentless_passive",passive & ~agent)
+	spec_tag3[passive & ~agent] = "agentless_passive"
+	return([["spec_tag3",spec_tag3]])
+
+def vector_adjective_analysis(columns,feature_dict): #see adjective_analysis()
+	spec_tag1 = empty_tags(columns)
+	semantic_tag1 = empty_tags(columns)
+	mask = column_mask(columns,"dep",["acomp"])
+	count_mask(feature_dict,"jj_predicative",mask)
+	spec_tag1[mask] = "jj_predicative"
+	classes = column_values(columns,"lemma",lambda x: adj_dict[x.lower()] if x.lower() in adj_dict and adj_dict[x.lower()] in adj_attr_set else None)
+	mask = mask & (classes != None)
+	count_values(feature_dict,classes[mask])
+	semantic_tag1[mask] = classes[mask]
+	mask = column_mask(columns,"dep",["amod"])
+	count_mask(feature_dict,"jj_attributive",mask)
+	spec_tag1[mask] = "jj_attributive"
+	return([["spec_tag1",spec_tag1],["semantic_tag1",semantic_tag1]])
+
+def vector_wrd_nchar(columns,feature_dict): #see wrd_nchar()
+	mask = ~column_mask(columns,"pos",["PUNCT","SYM","SPACE","X"])
+	texts, text_idx = columns["text"]
+	lemmas, lemma_idx = columns["lemma"]
+	pos, pos_idx = columns["pos"]
+	feature_dict["wrd_length"] += int(np.array([len(x) for x in texts],dtype = "int64")[text_idx][mask].sum())
+	count_mask(feature_dict,"nwords",mask)
+	window = feature_dict["mattr"]
+	lemma_ids = np.array(window.string_ids(lemmas),dtype = "int64")[lemma_idx] #integer id for each lemma (spaCy 2 "-PRON-" lemmas are replaced by the lowercase word)
+	if "-PRON-" in lemmas:
+		for i in np.flatnonzero(lemma_idx == lemmas.index("-PRON-")).tolist():
+			lemma_ids[i] = window.string_ids([texts[text_idx[i]].lower()])[0]
+	pos_ids = np.array(window.string_ids(pos),dtype = "int64")[pos_idx]
+	window.update(((lemma_ids << 32) | pos_ids)[mask].tolist()) #lemma_pos ids (same as pair_id())
+	if feature_dict["lemma_text"] != None:
+		for i in np.flatnonzero(mask).tolist():
+			if lemmas[lemma_idx[i]] == "-PRON-":
+				lemma = texts[text_idx[i]].lower()
+			else:
+				lemma = lemmas[lemma_idx[i]]
+			feature_dict["lemma_text"].append(lemma + "_" + pos[pos_idx[i]])
+	return([])
+
+def vector_noun_phrase_complexity(columns,feature_dict): #see noun_phrase_complexity()
+	noun = column_mask(columns,"pos",["NOUN"])
+	count_mask(feature_dict,"np",noun)
+	feature_dict["np_deps"] += int(child_count(columns)[noun].sum())
+	for dep in np_dep_features:
+		feature_dict[np_dep_features[dep]] += int(child_count(columns,column_mask(columns,"dep",[dep]))[noun].sum())
+	return([])
+
+def vector_clausal_complexity(columns,feature_dict): #see clausal_complexity()
+	clause = column_mask(columns,"pos",["VERB"]) & ~column_mask(columns,"dep",["aux"])
+	count_mask(feature_dict,"all_clauses",clause)
+	finite = clause & child_mask(columns,column_mask(columns,"dep",["nsubj","nsubjpass"]))
+	count_mask(feature_dict,"finite_clause",finite)
+	independent = column_mask(columns,"dep",["ROOT","conj"])
+	count_mask(feature_dict,"finite_ind_clause",finite & independent)
+	count_mask(feature_dict,"finite_dep_clause",finite & ~independent)
+	count_mask(feature_dict,"finite_compl_clause",finite & column_mask(columns,"dep",["ccomp"]))
+	count_mask(feature_dict,"finite_relative_clause",finite & column_mask(columns,"dep",["relcl"]))
+	count_mask(feature_dict,"nonfinite_clause",clause & ~finite)
+	feature_dict["vp_deps"] += int(child_count(columns)[clause].sum())
+	return([])
+
+#############################
+
+### Rule dispatch ###
+#Each rule is listed in the order that the rules are applied, along with the token properties that allow it to fire
+#(all rules also check their own conditions). A rule is only called for tokens that match at least one of its triggers:
+#"pos", "dep", "tag", "word" (lowercase text), "lemma" (lowercase lemma), or "not_pos" (any pos except these).
+#All rules are called with the same arguments: (token, index in sentence, all tokens, sentence tokens, token dictionary, feature dictionary)
+#"vector" = array version of the rule (see the vectorized rule engine), "partial" = the part of the rule that is not covered by "vector"
+#"prepare" = function that is run once per Doc before tagging: prepare(views, list of (start, end) for each sentence)
+lgr_rules = [
+	{"name" : "pronoun_analysis", "indices" : "pp_all pp1 pp2 pp3 pp3_it".split(" "),
+		"word" : pp_all_set,
+		"vector" : vector_pronoun_analysis,
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: pronoun_analysis(token,token_d,feature_dict)},
+	{"name" : "advanced_pronoun", "indices" : ["pp_indefinite","pp_demonstrative"],
+		"word" : indefinite_set | demonstrative_set,
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: advanced_pronoun(token,views,token_d,feature_dict)},
+	{"name" : "pro_verb", "indices" : ["pv_do"],
+		"lemma" : ["do"],
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: pro_verb(token,token_d,feature_dict)},
+	{"name" : "contraction_check", "indices" : ["contraction"],
+		"word" : contraction_set,
+		"vector" : vector_contraction_check,
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: contraction_check(token,token_d,feature_dict)},
+	{"name" : "split_aux_check", "indices" : ["split_aux"],
+		"pos" : ["VERB"],
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: split_aux_check(token,token_d,feature_dict)},
+	{"name" : "prep_analysis", "indices" : "adverbial_subordinator_causitive adverbial_subordinator_conditional adverbial_subordinator_other prep_phrase".split(" "),
+		"dep" : ["mark","prep"],
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: prep_analysis(token,token_d,feature_dict)},
+	{"name" : "coordination_analysis", "indices" : ["cc_clause","cc_phrase"],
+		"word" : ["and","or"],
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: coordination_analysis(token,w_count,token_d,feature_dict)},
+	{"name" : "wh_analysis", "indices" : "wh_question wh_clause wh_relative_clause wh_relative_prep_clause wh_relative_subj_clause wh_relative_obj_clause".split(" "),
+		"tag" : ["WDT","WP", "WP$", "WRB"],
+		"function" : wh_analysis},
+	{"name" : "noun_analysis", "indices" : ["nn_all","nominalization"],
+		"pos" : ["NOUN","PROPN"],
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: noun_analysis(token,token_d,feature_dict)},
+	{"name" : "semantic_analysis_noun", "indices" : list(noun_var_set & set(noun_dict.values())),
+		"pos" : ["NOUN","PROPN"],
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: semantic_analysis_noun(token,token_d,feature_dict)},
+	{"name" : "be_analysis", "indices" : ["be_mv"],
+		"lemma" : ["be"],
+		"vector" : vector_be_analysis,
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: be_analysis(token,token_d,feature_dict)},
+	{"name" : "verb_analysis", "indices" : "verb modal_possibility modal_necessity modal_predictive past_tense non_past_tense perfect_aspect complementizer_that0 past_participial_clause to_clause to_clause_noun to_clause_verb to_clause_adjective".split(" ") + ["to_clause_verb_" + x[:-5] for x in to_verb_set & set(to_verb_dict.values())] + ["to_clause_adjective_" + x[:-4] for x in to_adj_set & set(adj_dict.values())],
+		"pos" : ["VERB"],
+		"vector" : vector_verb_analysis,
+		"partial" : lambda token,w_count,views,sent,token_d,feature_dict: verb_clause_analysis(token,views,token_d,feature_dict),
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: verb_analysis(token,views,token_d,feature_dict)},
+	{"name" : "passive_analysis", "indices" : ["by_passive","agentless_passive"],
+		"pos" : ["VERB"],
+		"vector" : vector_passive_analysis,
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: passive_analysis(token,token_d,feature_dict)},
+	{"name" : "semantic_analysis_verb", "indices" : ["all_phrasal_verbs"] + list(verb_var_set & set(verb_dict.values())) + list((intransitive_phrasal_set | transitive_phrasal_set) & set(phrasal_verb_dict.values())),
+		"pos" : ["VERB"],
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: semantic_analysis_verb(token,token_d,feature_dict)},
+	{"name" : "adjective_analysis", "indices" : ["jj_predicative","jj_attributive"] + list(adj_attr_set & set(adj_dict.values())),
+		"dep" : ["acomp","amod"],
+		"vector" : vector_adjective_analysis,
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: adjective_analysis(token,token_d,feature_dict)},
+	{"name" : "adverb_analysis", "indices" : ["discourse_particle"] + list((adv_var_set | adv_var_set2) & set(adv_dict.values())),
+		"pos" : ["ADV"], "dep" : ["npadvmod","advmod", "intj"], "word" : adverb_phrase_words,
+		"prepare" : mark_adverb_phrases,
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: adverb_analysis(token,w_count,token_d,feature_dict)},
+	{"name" : "that_analysis", "indices" : "that_relative_clause that_complement_clause that_verb_clause that_noun_clause that_adjective_clause that_adjective_clause_attitudinal that_adjective_clause_likelihood".split(" ") + ["that_verb_clause_" + x[:-5] for x in that_verb_set & set(that_verb_dict.values())] + ["that_noun_clause_" + x[3:] for x in that_noun_set],
+		"word" : ["that"],
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: that_analysis(token,views,token_d,feature_dict)},
+	{"name" : "wrd_nchar", "indices" : ["wrd_length","nwords","mattr"],
+		"not_pos" : ["PUNCT","SYM","SPACE","X"],
+		"vector" : vector_wrd_nchar,
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: wrd_nchar(token,feature_dict)},
+	{"name" : "noun_phrase_complexity", "indices" : ["np","np_deps"] + list(np_dep_features.values()),
+		"pos" : ["NOUN"],
+		"vector" : vector_noun_phrase_complexity,
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: noun_phrase_complexity(token,feature_dict)},
+	{"name" : "clausal_complexity", "indices" : "all_clauses finite_clause finite_ind_clause finite_dep_clause finite_compl_clause finite_relative_clause nonfinite_clause vp_deps".split(" "),
+		"pos" : ["VERB"],
+		"vector" : vector_clausal_complexity,
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: clausal_complexity(token,feature_dict)}
+	]
+
+def dispatch_table(rules,engine = "python",output = True): #lookup tables for finding the rules that can fire for a token (see token_rules())
+	"""Each entry in the table is (rule, (function, vector rule name)). With engine = "numpy", rules that have a vector version are
+	replaced by an entry that copies the rule's precomputed tags (only needed if output == True) and by their "partial" function (if any).
+	"""
+	entries = []
+	for rule in rules:
+		if engine == "numpy" and "vector" in rule:
+			if output == True:
+				entries.append((rule,(None,rule["name"])))
+			if "partial" in rule:
+				entries.append((rule,(rule["partial"],None)))
+		else:
+			entries.append((rule,(rule["function"],None)))
+	table = {"entries" : entries, "cache" : {}} #cache = token key -> tuple of (function, vector rule name)
+	for attr in ["word","lemma"]: #only these words/lemmas need to be distinguished in a token's key
+		table[attr] = set()
+		for rule in rules:
+			table[attr].update(rule.get(attr,[]))
+	return(table)
+
+lgr_dispatch = dispatch_table(lgr_rules)
+
+#Indices that are calculated after all tokens have been tagged: index -> [function of the index dictionary, indices it needs]
+derived_indices = {
+	"wrd_length" : [lambda d: safe_divide(d["wrd_length"],d["nwords"]), ["wrd_length","nwords"]],
+	"mattr" : [lambda d: d["mattr"].value(), ["mattr"]], #see MattrWindow
+	#noun phrase complexity
+	"mean_nominal_deps" : [lambda d: safe_divide(d["np_deps"],d["np"]), ["np_deps","np"]], #nominal (common noun) dependents,#of nominals (common nouns)
+	"relcl_nominal" : [lambda d: safe_divide(d["relcl_dep"],d["np"]), ["relcl_dep","np"]],
+	"amod_nominal" : [lambda d: safe_divide(d["amod_dep"],d["np"]), ["amod_dep","np"]],
+	"det_nominal" : [lambda d: safe_divide(d["det_dep"],d["np"]), ["det_dep","np"]],
+	"prep_nominal" : [lambda d: safe_divide(d["prep_dep"],d["np"]), ["prep_dep","np"]],
+	"poss_nominal" : [lambda d: safe_divide(d["poss_dep"],d["np"]), ["poss_dep","np"]],
+	"cc_nominal" : [lambda d: safe_divide(d["cc_dep"],d["np"]), ["cc_dep","np"]],
+	#clausal complexity
+	"mean_verbal_deps" : [lambda d: safe_divide(d["vp_deps"],d["finite_clause"]), ["vp_deps","finite_clause"]], #dependents per finite clause
+	"mlc" : [lambda d: safe_divide(d["nwords"],d["finite_clause"]), ["nwords","finite_clause"]], #number of words,number of finite clauses
+	"mltu" : [lambda d: safe_divide(d["nwords"],d["finite_ind_clause"]), ["nwords","finite_ind_clause"]], #number of words,number of independent finite clauses (T-units)
+	"dc_c" : [lambda d: safe_divide(d["finite_dep_clause"],d["finite_clause"]), ["finite_dep_clause","finite_clause"]], #number of dependent clauses,number of finite clauses (dependent clauses per clause)
+	"ccomp_c" : [lambda d: safe_divide(d["finite_compl_clause"],d["finite_clause"]), ["finite_compl_clause","finite_clause"]], #complement clauses,number of finite clauses
+	"relcl_c" : [lambda d: safe_divide(d["finite_relative_clause"],d["finite_clause"]), ["finite_relative_clause","finite_clause"]], #relative clauses,number of finite clauses
+	"infinitive_prop" : [lambda d: safe_divide(d["to_clause"],d["all_clauses"]), ["to_clause","all_clauses"]], #infinitive clauses,total number of clauses
+	"nonfinite_prop" : [lambda d: safe_divide(d["nonfinite_clause"],d["all_clauses"]), ["nonfinite_clause","all_clauses"]] #nonfinite clauses,total number of clauses
+	}
+
+rule_plans = {} #tuple of requested indices -> (rules, indices to count)
+rule_tables = {} #(tuple of requested indices, engine, output) -> dispatch table
+
+def rule_plan(indices_dict = index_list):
+	"""Selects the rules that are needed to calculate the requested indices (nwords is always calculated because it is used for norming).
+	Returns the selected rules and the list of indices to count (requested indices first).
+	"""
+	key = tuple(indices_dict)
+	if key not in rule_plans:
+		needed = set(indices_dict) | set(["nwords"])
+		for x in indices_dict:
+			if x in derived_indices:
+				needed.update(derived_indices[x][1])
+		rules = [rule for rule in lgr_rules if len(needed.intersection(rule["indices"])) > 0]
+		counts = list(indices_dict)
+		for rule in rules: #rules can only add to indices that have been initialized
+			for x in rule["indices"]:
+				if x not in counts:
+					counts.append(x)
+		rule_plans[key] = (rules,counts)
+	return(rule_plans[key])
+
+def rule_dispatch(indices_dict = index_list,engine = "python",output = True): #dispatch table for the rules selected by rule_plan()
+	key = (tuple(indices_dict),engine,output)
+	if key not in rule_tables:
+		rule_tables[key] = dispatch_table(rule_plan(indices_dict)[0],engine,output)
+	return(rule_tables[key])
+
+def token_rules(token,table = lgr_dispatch): #returns the (function, vector rule name) entries (in rule order) that can fire for a TokenView
+	word = token.lower_ if token.lower_ in table["word"] else None
+	lemma = token.lemma_lower if token.lemma_lower in table["lemma"] else None
+	key = (token.pos_,token.dep_,token.tag_,word,lemma)
+	if key not in table["cache"]: #each combination of properties is only checked once
+		values = {"pos" : token.pos_, "dep" : token.dep_, "tag" : token.tag_, "word" : word, "lemma" : lemma}
+		functions = []
+		for rule, entry in table["entries"]:
+			if "not_pos" in rule and token.pos_ not in rule["not_pos"]:
+				functions.append(entry)
+			elif True in [values[attr] in rule[attr] for attr in values if attr in rule]:
+				functions.append(entry)
+		table["cache"][key] = tuple(functions)
+	return(table["cache"][key])
+
+#############################
+
+### parse cache ###
+#Parsing is by far the slowest step. Parsed Docs can be saved to (and reloaded from) a cache folder so that
+#changes to the rules or word lists do not require re-parsing the corpus.
+#Cache entries are keyed by a hash of the cleaned text + the spacy version, model name/version, and disabled components.
+#Each Doc is stored as a DocBin file in one of 256 sub-folders (cache_dir/ab/abcd....spacy)
+cache_attrs = ["ORTH","LEMMA","POS","TAG","DEP","HEAD","SENT_START"] #token attributes stored for each parsed Doc
+model_signatures = {} #model signature for each model configuration (so that model metadata is only read once)
+blank_vocab = None #vocab used to load cached Docs when the model has not been loaded
+
+def model_signature(): #identifies the parser output: spacy version, model name and version, disabled components
+	config_key = (nlp_config["model"],tuple(nlp_config["disable"]))
+	if config_key not in model_signatures:
+		model = nlp_config["model"]
+		if loaded_nlp != None:
+			model_version = loaded_nlp.meta.get("version","")
+		elif spacy.util.is_package(model):
+			model_version = spacy.util.get_package_version(model)
+		else: #model is a path
+			model_version = spacy.util.get_model_meta(model).get("version","")
+		model_signatures[config_key] = "|".join(["spacy=" + spacy.__version__,"model=" + model,"version=" + str(model_version),"disable=" + ",".join(sorted(nlp_config["disable"]))])
+	return(model_signatures[config_key])
+
+def parse_cache_key(cleaned_text): #cleaned_text = output of clean_text()
+	return(hashlib.sha1((model_signature() + "\n" + cleaned_text).encode("utf-8")).hexdigest())
+
+def cache_filename(cache_dir,key):
+	return(os.path.join(cache_dir,key[:2],key + ".spacy"))
+
+def load_cached_doc(cache_dir,key): #returns a Doc, or None if the text has not been parsed yet
+	fname = cache_filename(cache_dir,key)
+	if os.path.exists(fname) == False:
+		return(None)
+	with open(fname,"rb") as inf:
+		return(list(DocBin().from_bytes(inf.read()).get_docs(parsed_vocab()))[0])
+
+def parsed_vocab(): #vocab for loading stored Docs (the model's vocab if it is loaded, otherwise a blank vocab)
+	global blank_vocab
+	if loaded_nlp != None:
+		return(loaded_nlp.vocab)
+	if blank_vocab == None:
+		blank_vocab = Vocab()
+	return(blank_vocab)
+
+def save_cached_doc(cache_dir,key,doc):
+	fname = cache_filename(cache_dir,key)
+	os.makedirs(os.path.dirname(fname),exist_ok = True)
+	tmpname = fname + "." + str(os.getpid()) + ".tmp" #write to a temporary file first so that parallel workers never read a partial file
+	with open(tmpname,"wb") as outf:
+		outf.write(DocBin(attrs = cache_attrs,docs = [doc]).to_bytes())
+	os.replace(tmpname,fname)
+
+def parse_texts(cleaned_texts,batch_size = None,cache_dir = None):
+	"""Parse a list of cleaned texts with nlp.pipe(). If cache_dir is given, cached Docs are used and new Docs are saved to the cache (the model is only loaded if at least one text is not in the cache).
+	Returns a list with a Doc for each text (or the Exception raised while parsing it).
+	"""
+	docs = [None] * len(cleaned_texts)
+	keys = [None] * len(cleaned_texts)
+	if cache_dir != None:
+		for position, text in enumerate(cleaned_texts):
+			keys[position] = parse_cache_key(text)
+			docs[position] = load_cached_doc(cache_dir,keys[position])
+	to_parse = [(text,position) for position, text in enumerate(cleaned_texts) if docs[position] == None]
+	if len(to_parse) > 0:
+		nlp = load_nlp()
+		try:
+			for doc, position in nlp.pipe(to_parse,batch_size = batch_size,as_tuples = True):
+				docs[position] = doc
+		except Exception: #if one text breaks the batch, parse the remaining texts one at a time
+			for text, position in to_parse:
+				if docs[position] == None:
+					try:
+						docs[position] = nlp(text)
+					except Exception as e:
+						docs[position] = e
+		if cache_dir != None:
+			for text, position in to_parse:
+				if isinstance(docs[position],Exception) == False:
+					save_cached_doc(cache_dir,keys[position],docs[position])
+	return(docs)
+
 #### These functions use the previous functions to conduct tagging and tallying of lexicogramamtical features ###
 
-def LGR_Analysis(text,indices_dict=index_list,cats_d = cats,output = False):
+def LGR_Analysis(text,indices_dict=index_list,cats_d = cats,output = True,cache_dir = None,lemma_text = False,mattr_window = 50,chunk_size = None,batch_size = 2): #output = False skips building tagged_text; cache_dir = optional folder for cached parses (see parse_texts()); lemma_text = True adds the lemma_pos list
+	"""Texts that are longer than chunk_size characters (default = max_length; see configure_nlp()) are split into chunks at paragraph or sentence boundaries (see split_text()).
+	The chunks are parsed batch_size chunks at a time and tagged one at a time, and their counts are combined (see LGR_Docs_Analysis()).
+	"""
+	if chunk_size == None:
+		chunk_size = nlp_config["max_length"]
+	chunks = split_text(clean_text(text),chunk_size)
+	return(LGR_Docs_Analysis(chunk_docs(chunks,cache_dir,batch_size),indices_dict,cats_d,output,lemma_text = lemma_text,mattr_window = mattr_window))
+
+chunk_boundaries = [re.compile(r"\n\s*\n"),re.compile(r"\n"),re.compile(r"[.!?][\"')\]]*\s+"),re.compile(r"\s+")] #paragraph breaks, line breaks, sentence ends, and spaces (in order of preference)
+
+def split_text(text,chunk_size):
+	"""Splits a text into chunks of at most chunk_size characters (joined together, the chunks are the original text).
+	Each chunk ends after the last paragraph break in it if possible (otherwise the last line break, sentence end, or space). Boundaries in the first half of a chunk are not used.
+	"""
+	chunks = []
+	start = 0
+	while len(text) - start > chunk_size:
+		window = text[start:start + chunk_size]
+		end = chunk_size #if there are no boundaries, the chunk is cut at chunk_size characters
+		for pattern in chunk_boundaries:
+			last = None
+			for last in pattern.finditer(window,chunk_size // 2):
+				pass
+			if last != None:
+				end = last.end()
+				break
+		chunks.append(text[start:start + end])
+		start += end
+	chunks.append(text[start:])
+	return(chunks)
+
+def chunk_docs(chunks,cache_dir = None,batch_size = 2): #yields a Doc for each chunk of a text (see split_text()). The chunks are parsed batch_size at a time (chunks can be as long as max_length), so only one small batch of Docs is held in memory
+	if cache_dir != None:
+		for group in text_groups(chunks,batch_size):
+			for doc in parse_texts(group,batch_size,cache_dir):
+				if isinstance(doc,Exception):
+					raise doc
+				yield(doc)
+	elif len(chunks) == 1:
+		yield(load_nlp()(chunks[0]))
+	else:
+		for doc in load_nlp().pipe(chunks,batch_size = batch_size):
+			yield(doc)
+
+def LGR_Batch(texts,indices_dict=index_list,cats_d = cats,batch_size = None,as_tuples = False,cache_dir = None,output = True,lemma_text = False,mattr_window = 50,chunk_size = None):
+	"""Analyze an iterable of texts with nlp.pipe() (much faster than one nlp() call per text). Results are yielded in input order.
+	batch_size = number of texts per batch (None = spacy model default)
+	as_tuples = if True, texts are (text, context) tuples and (result, context) tuples are yielded (e.g., context = filename)
+	cache_dir = optional folder for cached parses (see parse_texts())
+	output = if False, "tagged_text" is not built (see LGR_Doc_Analysis())
+	lemma_text, mattr_window = see LGR_Doc_Analysis()
+	chunk_size = texts that are longer than this (default = max_length) are parsed in chunks and analyzed like LGR_Analysis() does
+	"""
+	if chunk_size == None:
+		chunk_size = nlp_config["max_length"]
+	if as_tuples == False:
+		texts = ((text,None) for text in texts)
+	def pipe_texts(): #(text, (context, chunks)); a long text is replaced by an empty placeholder in the batch and its chunks are parsed separately
+		for text, context in texts:
+			cleaned = clean_text(text)
+			if len(cleaned) > chunk_size:
+				yield(("",(context,split_text(cleaned,chunk_size))))
+			else:
+				yield((cleaned,(context,None)))
+	if cache_dir == None:
+		parsed = load_nlp().pipe(pipe_texts(),batch_size = batch_size,as_tuples = True)
+	else:
+		def cached_groups(): #parse (or load) one group of texts at a time
+			for group in text_groups(pipe_texts(),batch_size):
+				docs = parse_texts([text for text,context in group],batch_size,cache_dir)
+				for doc, (text,context) in zip(docs,group):
+					if isinstance(doc,Exception):
+						raise doc
+					yield((doc,context))
+		parsed = cached_groups()
+	for doc, (context,chunks) in parsed:
+		if chunks != None:
+			doc = chunk_docs(chunks,cache_dir)
+		else:
+			doc = [doc]
+		if as_tuples == True:
+			yield((LGR_Docs_Analysis(doc,indices_dict,cats_d,output,lemma_text = lemma_text,mattr_window = mattr_window),context))
+		else:
+			yield(LGR_Docs_Analysis(doc,indices_dict,cats_d,output,lemma_text = lemma_text,mattr_window = mattr_window))
+
+def text_groups(items,batch_size = None): #splits an iterable into lists of batch_size items (64 if batch_size is None)
+	if batch_size == None:
+		batch_size = 64
+	group = []
+	for item in items:
+		group.append(item)
+		if len(group) >= batch_size:
+			yield(group)
+			group = []
+	if len(group) > 0:
+		yield(group)
+
+def LGR_Safe_Batch(texts,indices_dict=index_list,cats_d = cats,batch_size = None,cache_dir = None,output = True,token_budget = None,sort_size = 1024,chunk_size = None):
+	"""Like LGR_Batch(as_tuples = True), but a text that cannot be parsed or tagged does not stop the other texts from being processed.
+	texts = iterable of (text, context) tuples
+	token_budget = if set, texts are read in groups of sort_size texts, and each group is parsed in batches of texts with similar lengths (see token_batches()) instead of batches of batch_size texts
+	chunk_size = texts that are longer than this (default = max_length) are parsed in chunks when their turn comes (see LGR_Analysis())
+	Yields (result, context, error) tuples in input order. If a text failed, result is None and error is a description of the problem (otherwise error is None).
+	"""
+	if chunk_size == None:
+		chunk_size = nlp_config["max_length"]
+	if token_budget != None:
+		batch_size = sort_size
+	for group in text_groups(texts,batch_size):
+		cleaned = [] #(cleaned text, context, error)
+		for text, context in group:
+			try:
+				cleaned.append((clean_text(text),context,None))
+			except Exception as e:
+				cleaned.append((None,context,repr(e)))
+		positions = [position for position, (text,context,error) in enumerate(cleaned) if error == None and len(text) <= chunk_size] #long texts are not parsed with the group
+		if token_budget == None:
+			docs = dict(zip(positions,parse_texts([cleaned[position][0] for position in positions],batch_size,cache_dir)))
+		else: #Docs are kept until the whole group has been parsed (results are yielded in input order)
+			docs = {}
+			for batch in token_batches([cleaned[position][0] for position in positions],token_budget):
+				batch = [positions[x] for x in batch]
+				docs.update(zip(batch,parse_texts([cleaned[position][0] for position in batch],len(batch),cache_dir)))
+		for position, (text,context,error) in enumerate(cleaned):
+			if error != None:
+				yield((None,context,error))
+			elif len(text) > chunk_size:
+				try:
+					yield((LGR_Docs_Analysis(chunk_docs(split_text(text,chunk_size),cache_dir),indices_dict,cats_d,output),context,None))
+				except Exception as e:
+					yield((None,context,repr(e)))
+			elif isinstance(docs[position],Exception):
+				yield((None,context,repr(docs[position])))
+			else:
+				try:
+					yield((LGR_Doc_Analysis(docs[position],indices_dict,cats_d,output),context,None))
+				except Exception as e:
+					yield((None,context,repr(e)))
+
+def token_estimate(text): #estimated number of tokens in a text (used for scheduling; see token_batches())
+	return(len(text.split()) + 1)
+
+def token_batches(texts,token_budget):
+	"""Groups texts into batches for parsing. The texts are sorted by length (see token_estimate()), so texts with similar lengths are parsed together
+	(short texts are not padded to the length of long ones), and each batch has at most token_budget tokens including padding (number of texts * longest text).
+	A text that is longer than token_budget is parsed on its own. Returns a list of batches (lists of positions in texts).
+	"""
+	estimates = [token_estimate(text) for text in texts]
+	batches = []
+	batch = []
+	for position in sorted(range(len(texts)),key = lambda x: estimates[x]):
+		if len(batch) > 0 and estimates[position] * (len(batch) + 1) > token_budget: #the current text is the longest one in the batch
+			batches.append(batch)
+			batch = []
+		batch.append(position)
+	if len(batch) > 0:
+		batches.append(batch)
+	return(batches)
+
+numpy_min_tokens = 1000 #engine = "auto" uses the numpy engine for Docs with at least this many tokens (the numpy engine has a fixed setup cost per Doc; it was faster from about 500-2000 tokens in tests)
+
+def LGR_Doc_Analysis(doc,indices_dict=index_list,cats_d = cats,output = True,engine = "auto",lemma_text = False,mattr_window = 50): #tags and counts features in an already-parsed spacy Doc
+	"""Only the rules needed for indices_dict are run (see rule_plan()).
+	output = if False, the per-token tag records are not built and "tagged_text" is None (faster when annotated output is not needed)
+	tagged_text = list of sentences (lists of TaggedToken records; these are regular dictionaries if cats_d is not the default)
+	engine = "numpy" (rules with a vector version are applied to whole-Doc arrays), "python" (all rules are applied token by token), or "auto" (numpy for Docs with at least numpy_min_tokens tokens). All give the same results.
+	lemma_text = if True, "lemma_text" is the list of lemma_pos strings for the words in the text (otherwise it is None; MATTR does not need it)
+	mattr_window = window length for MATTR (see MattrWindow)
+	"""
+	return(LGR_Docs_Analysis([doc],indices_dict,cats_d,output,engine,lemma_text,mattr_window))
+
+def LGR_Docs_Analysis(docs,indices_dict=index_list,cats_d = cats,output = True,engine = "auto",lemma_text = False,mattr_window = 50):
+	"""Tags and counts features in consecutive parts (Docs) of one text (e.g., the chunks of a long text; see split_text()) as if they were a single Doc.
+	Counts, lemma_text, and the MATTR window continue across the parts, tagged_text is a single list (idx and head idx are numbered across the parts),
+	and ratios are calculated from the combined counts. Each Doc can be discarded once it has been tagged (docs can be a generator). See LGR_Doc_Analysis() for the other arguments.
+	"""
+	counts = IndexCounts(indices_dict,lemma_text,mattr_window)
+	if output == True:
+		output_list = []
+	else:
+		output_list = None
+	previous = None #last token of the previous Doc
+	for doc in docs:
+		previous = tag_doc(doc,counts.index_dict,output_list,indices_dict,cats_d,engine,previous)
+	index_dict = counts.finalize()
+	index_dict["tagged_text"] = output_list
+	return(index_dict)
+
+def LGR_Doc_Counts(doc,indices_dict=index_list,engine = "auto",lemma_text = False,mattr_window = 50): #tags a Doc and returns its raw counts (an IndexCounts that can be merged with the counts for other parts of the text or for other texts)
+	counts = IndexCounts(indices_dict,lemma_text,mattr_window)
+	tag_doc(doc,counts.index_dict,None,indices_dict,cats,engine)
+	return(counts)
+
+def start_counts(indices_dict=index_list,lemma_text = False,mattr_window = 50): #index dictionary (counts start at 0) for IndexCounts
+	rules, counts = rule_plan(indices_dict)
 	index_dict = {}
-	for x in indices_dict:
+	for x in counts:
 		index_dict[x] = 0 #start index counts
-	index_dict["lemma_text"] = []
-	def clean_text(in_text):
-		
-		if "[" in in_text and "]" in in_text:
-			in_text = re.sub("\[.*?\]","",in_text)
-		if "1:" in in_text:
-			in_text = re.sub("\n[0-9]:","",in_text)
-		if " " in in_text:
-			if "\n" not in in_text:
-				in_text = " ".join(in_text.split())
-			else:
-				line_text = []
-				for x in in_text.split("\n"):
-					line_text.append(" ".join(x.split()))
-				in_text = "\n".join(line_text)
-		return(in_text)
-		
-	doc = nlp(clean_text(text))
-	
-	output_list = []
+	if "mattr" in index_dict:
+		index_dict["mattr"] = MattrWindow(mattr_window) #replaced by the MATTR value after tagging (see derived_indices)
+	if lemma_text == True:
+		index_dict["lemma_text"] = []
+	else:
+		index_dict["lemma_text"] = None
+	return(index_dict)
+
+def tag_doc(doc,index_dict,output_list,indices_dict=index_list,cats_d = cats,engine = "auto",previous = None,tag_columns = None):
+	"""Applies the rules to one Doc. Counts are added to index_dict, and sentences are added to output_list (unless it is None).
+	previous = last token (TokenView) of the previous part of the text (see LGR_Docs_Analysis()). Returns a copy of the last token of this Doc.
+	tag_columns = if output_list is None, the tags can be written to a TagColumns object instead (no per-token records are built)
+	"""
+	if engine == "auto":
+		if len(doc) >= numpy_min_tokens:
+			engine = "numpy"
+		else:
+			engine = "python"
+	output = output_list != None
+	rules = rule_plan(indices_dict)[0]
+	table = rule_dispatch(indices_dict,engine,output or tag_columns != None)
+	vector_tags = {} #vector rule name -> list of [tag slot, array of tags]
+	if engine == "numpy":
+		columns = doc_columns(doc)
+		views = column_views(columns)
+		for rule in rules:
+			if "vector" in rule:
+				vector_tags[rule["name"]] = rule["vector"](columns,index_dict)
+	else:
+		views = doc_views(doc) #token attributes are looked up once here and shared by all of the rule functions
+	if len(views) == 0:
+		return(previous)
+	if previous != None:
+		views[0].prev = previous #instead of the last token of this Doc
+	sent_bounds = [(span.start,span.end) for span in doc.sents]
+	for rule in rules:
+		if "prepare" in rule:
+			rule["prepare"](views,sent_bounds)
+
+	token_attrs = {} #when output == False, the rules write their tags to this (discarded) dictionary
+	if output == False and tag_columns != None:
+		token_attrs = tag_columns
+	records = list(cats_d) == list(cats) #TaggedToken records can only hold the default tag slots
 	sent_idx = 0 #sentence counter
-	for sent in doc.sents:
-		output_list.append([])#add empty sentence-level list that will be filled below
+	offset = 0 #number of tokens in earlier Docs (see LGR_Docs_Analysis())
+	if output == True:
+		sent_idx = len(output_list) // 2 #each sentence adds two lists (the second one stays empty)
+		offset = sum([len(sent) for sent in output_list[:sent_idx]])
+	if output == True and records == True:
+		index_strings = [str(x + offset) for x in range(len(views))]
+	for start, end in sent_bounds:
+		sent = views[start:end]
+		if output == True:
+			output_list.append([])#add empty sentence-level list that will be filled below
+			output_list.append([])
 		idx_sent = 0 #token witin sentence counter
-		output_list.append([])
 		for token in sent:
-			#create token dictionary and populate it
-			token_attrs = {}
-			for x in cats_d:
-				token_attrs[x] = None
-			
-			basic_info(token, token_attrs)
-			pronoun_analysis(token,token_attrs,index_dict)
-			advanced_pronoun(token,doc,token_attrs,index_dict)
-			pro_verb(token,token_attrs,index_dict)
-			
-			contraction_check(token,token_attrs,index_dict)
-			split_aux_check(token,token_attrs,index_dict)
-			
-			prep_analysis(token,token_attrs,index_dict)
-			
-			coordination_analysis(token,idx_sent,token_attrs,index_dict)
-			
-			wh_analysis(token,idx_sent,doc,sent,token_attrs,index_dict)
-			
-			noun_analysis(token,token_attrs,index_dict)
-			semantic_analysis_noun(token,token_attrs,index_dict)
-			
-			be_analysis(token,token_attrs,index_dict)
-			verb_analysis(token,doc,token_attrs,index_dict)
-			passive_analysis(token,token_attrs,index_dict)
-			semantic_analysis_verb(token,token_attrs,index_dict)
-			
-			adjective_analysis(token,token_attrs,index_dict)
-			adverb_analysis(token,idx_sent,token_attrs,index_dict)
-			
-			that_analysis(token,doc,token_attrs,index_dict)
-			wrd_nchar(token,index_dict)
-			noun_phrase_complexity(token,index_dict)
-			clausal_complexity(token,index_dict)
-
-			output_list[sent_idx].append(token_attrs)
+			if output == True and records == True:
+				token_attrs = TaggedToken(token,index_strings)
+			elif output == True:
+				#create token dictionary and populate it
+				token_attrs = {}
+				for x in cats_d:
+					token_attrs[x] = None
+				basic_info(token, token_attrs, offset)
+			elif tag_columns != None:
+				tag_columns.i = token.i
+			for function, vector_name in token_rules(token,table): #only the rules that can fire for this token's pos/dep/tag/word/lemma (see lgr_rules)
+				if function != None:
+					function(token,idx_sent,views,sent,token_attrs,index_dict)
+				else: #copy precomputed tags (at the rule's position, so that later rules overwrite them as before)
+					for slot, values in vector_tags[vector_name]:
+						if values[token.i] != None:
+							token_attrs[slot] = values[token.i]
+			if output == True:
+				output_list[sent_idx].append(token_attrs)
 			idx_sent +=1
 		sent_idx += 1
-	
-	
-		
-	index_dict["tagged_text"] = output_list
-	index_dict["wrd_length"] = index_dict["wrd_length"]/index_dict["nwords"]
-	index_dict["mattr"] = ld.mattr(index_dict["lemma_text"])
-	#noun phrase complexity
-	index_dict["mean_nominal_deps"] = safe_divide(index_dict["np_deps"],index_dict["np"]) #nominal (common noun) dependents,#of nominals (common nouns)
-	index_dict["relcl_nominal"] = safe_divide(index_dict["relcl_dep"],index_dict["np"])
-	index_dict["amod_nominal"] = safe_divide(index_dict["amod_dep"],index_dict["np"])
-	index_dict["det_nominal"] = safe_divide(index_dict["det_dep"],index_dict["np"])
-	index_dict["prep_nominal"] = safe_divide(index_dict["prep_dep"],index_dict["np"])
-	index_dict["poss_nominal"] = safe_divide(index_dict["poss_dep"],index_dict["np"])
-	index_dict["cc_nominal"] = safe_divide(index_dict["cc_dep"],index_dict["np"])
-
-	index_dict["mean_verbal_deps"] = safe_divide(index_dict["vp_deps"],index_dict["finite_clause"]) #dependents per finite clause
-	index_dict["mlc"] = safe_divide(index_dict["nwords"],index_dict["finite_clause"]) #number of words,number of finite clauses
-	index_dict["mltu"] = safe_divide(index_dict["nwords"],index_dict["finite_ind_clause"]) #number of words,number of independent finite clauses (T-units)
-	index_dict["dc_c"] = safe_divide(index_dict["finite_dep_clause"],index_dict["finite_clause"]) #number of dependent clauses,number of finite clauses (dependent clauses per clause)
-
-	index_dict["ccomp_c"] = safe_divide(index_dict["finite_compl_clause"],index_dict["finite_clause"]) #complement clauses,number of finite clauses
-	index_dict["relcl_c"] = safe_divide(index_dict["finite_relative_clause"],index_dict["finite_clause"]) #relative clauses,number of finite clauses
-	index_dict["infinitive_prop"] = safe_divide(index_dict["to_clause"],index_dict["all_clauses"]) #infinitive clauses,total number of clauses
-	index_dict["nonfinite_prop"] = safe_divide(index_dict["nonfinite_clause"],index_dict["all_clauses"]) #nonfinite clauses,total number of clauses
-	
+	last = views[-1]
+	return(TokenView(last.text,last.lower_,last.lemma_,last.lemma_lower,last.pos_,last.tag_,last.dep_,last.i)) #not linked to the other tokens (earlier Docs are not kept in memory)
 
-	return(index_dict)
+class IndexCounts:
+	"""Raw counts for a text, a part of a text, or a corpus (see LGR_Doc_Counts()). Only the values needed to calculate the indices are kept
+	(counts, the MATTR window, and lemma_text if it is requested), so counts that were calculated separately (e.g., for the chunks of a long text,
+	or for subcorpora on different computers; IndexCounts can be pickled) can be combined with merge(). finalize() calculates the index values.
+	"""
+	def __init__(self,indices_dict=index_list,lemma_text = False,mattr_window = 50):
+		self.indices_dict = list(indices_dict)
+		self.index_dict = start_counts(indices_dict,lemma_text,mattr_window) #raw counts (see tag_doc())
+
+	def merge(self,other):
+		"""Adds the counts of another IndexCounts (for the same indices). The other counts are treated as the part of the text (or corpus) that follows
+		this one: MATTR is calculated as if the lemmas were in one text (see MattrWindow.merge()), and lemma_text is extended.
+		"""
+		if other.indices_dict != self.indices_dict:
+			raise ValueError("counts for different indices cannot be merged")
+		for x in self.index_dict:
+			if x == "mattr":
+				self.index_dict[x].merge(other.index_dict[x])
+			elif x == "lemma_text":
+				if self.index_dict[x] != None and other.index_dict[x] != None:
+					self.index_dict[x] += other.index_dict[x]
+				else:
+					self.index_dict[x] = None #lemma_text is only kept if it is available for all parts
+			else:
+				self.index_dict[x] += other.index_dict[x]
+		return(self)
+
+	def finalize(self): #index values (ratios, etc. are calculated from the combined counts). The counts are not changed, so more counts can be merged later
+		index_dict = dict(self.index_dict)
+		if index_dict["lemma_text"] != None:
+			index_dict["lemma_text"] = list(index_dict["lemma_text"])
+		for x in derived_indices: #only those that are requested or that have counts
+			if x in index_dict:
+				index_dict[x] = derived_indices[x][0](index_dict)
+		return(index_dict)
+
+
+### spacy pipeline component
+#With nlp.add_pipe("lgr_tagger") (after the parser), each Doc is tagged as it is parsed (also in nlp.pipe() worker processes when n_process > 1).
+#Tags are stored in doc._.lgr_tags (one list per tag slot, e.g., doc._.lgr_tags["main_tag"][i]) and read with Token extensions (e.g., token._.main_tag).
+#The index values (see LGR_Doc_Analysis(), without tagged_text) are stored in doc._.lgr_indices. Both are saved with the Doc (e.g., DocBin(store_user_data = True)).
+
+def token_tag(cat,token): #getter for the Token extensions
+	if token.doc._.lgr_tags == None: #the Doc has not been tagged
+		return(None)
+	return(token.doc._.lgr_tags[cat][token.i])
+
+class TagColumns:
+	"""Stores tags as one list per tag slot (see doc._.lgr_tags). The rules write the tags for the current token (i) with tag_columns[slot] = tag,
+	so no record is built for each token. Tags that are not in cats_d (e.g., main_tag2) are not kept.
+	"""
+	__slots__ = ["columns","i"]
+
+	def __init__(self,n_tokens,cats_d = cats):
+		self.columns = dict([(x,[None] * n_tokens) for x in cats_d]) #tag slot -> tag for each token
+		self.i = 0 #current token
+
+	def __setitem__(self,key,value):
+		if key in self.columns:
+			self.columns[key][self.i] = value
+
+def lgr_extensions(): #registers the Doc and Token extensions used by lgr_tagger (run at import)
+	for name in ["lgr_tags","lgr_indices"]:
+		if Doc.has_extension(name) == False:
+			Doc.set_extension(name,default = None)
+	for cat in cats:
+		if Token.has_extension(cat) == False:
+			Token.set_extension(cat,getter = functools.partial(token_tag,cat))
+
+lgr_extensions()
+
+def lgr_tag_doc(doc,indices_dict = index_list,tags = True,engine = "auto",lemma_text = False,mattr_window = 50): #the lgr_tagger component (see make_lgr_tagger())
+	counts = IndexCounts(indices_dict,lemma_text,mattr_window)
+	if tags == True:
+		tag_columns = TagColumns(len(doc))
+		tag_doc(doc,counts.index_dict,None,indices_dict,cats,engine,tag_columns = tag_columns)
+		doc._.lgr_tags = tag_columns.columns
+	else:
+		tag_doc(doc,counts.index_dict,None,indices_dict,cats,engine)
+	doc._.lgr_indices = counts.finalize()
+	return(doc)
+
+@Language.factory("lgr_tagger",default_config = {"indices" : None, "tags" : True, "engine" : "auto", "lemma_text" : False, "mattr_window" : 50})
+def make_lgr_tagger(nlp,name,indices,tags,engine,lemma_text,mattr_window):
+	"""spacy factory for the lgr_tagger component (e.g., nlp.add_pipe("lgr_tagger",config = {"indices" : ["mlc","mltu"]})).
+	indices = list of indices (None = index_list); tags = if False, only doc._.lgr_indices is set (faster). See LGR_Doc_Analysis() for the other settings.
+	"""
+	if indices == None:
+		indices = index_list
+	return(functools.partial(lgr_tag_doc,indices_dict = list(indices),tags = tags,engine = engine,lemma_text = lemma_text,mattr_window = mattr_window))
 
+vertical_formats = {"full" : ['idx','word','lemma','pos','tag','dep_rel','head','head idx','main_tag','spec_tag1','spec_tag2','spec_tag3','spec_tag4','spec_tag5','spec_tag6','semantic_tag1','semantic_tag2'],
+	"simple" : ['idx','word','lemma','tag', 'dep_rel','head idx','main_tag','spec_tag1','spec_tag2','spec_tag3','spec_tag4','spec_tag5','spec_tag6','semantic_tag1','semantic_tag2']} #columns in vertical output files
 
 def output_vertical(list_text,outname,ordered_output = "simple",prettyp = False): #list version of parsed text, list of attributes to output, name of output file
 	if ordered_output == "full":
-		ordered_output = ['idx','word','lemma','pos','tag','dep_rel','head','head idx','main_tag','spec_tag1','spec_tag2','spec_tag3','spec_tag4','spec_tag5','spec_tag6','semantic_tag1','semantic_tag2']
+		ordered_output = vertical_formats["full"]
 	elif ordered_output == "simple":
-		ordered_output = ['idx','word','lemma','tag', 'dep_rel','head idx','main_tag','spec_tag1','spec_tag2','spec_tag3','spec_tag4','spec_tag5','spec_tag6','semantic_tag1','semantic_tag2']
+		ordered_output = vertical_formats["simple"]
 	
 	outf = open(outname,"w") #create output file
 	for sent_id, sent in enumerate(list_text):
@@ -828,9 +1941,9 @@ def output_vertical(list_text,outname,ordered_output = "simple",prettyp = False)
 
 def print_vertical(list_text,ordered_output = "simple"):
 	if ordered_output == "full":
-		ordered_output = ['idx','word','lemma','pos','tag','dep_rel','head','head idx','main_tag','spec_tag1','spec_tag2','spec_tag3','spec_tag4','spec_tag5','spec_tag6','semantic_tag1','semantic_tag2']
+		ordered_output = vertical_formats["full"]
 	elif ordered_output == "simple":
-		ordered_output = ['idx','word','lemma','tag', 'dep_rel','head idx','main_tag','spec_tag1','spec_tag2','spec_tag3','spec_tag4','spec_tag5','spec_tag6','semantic_tag1','semantic_tag2']
+		ordered_output = vertical_formats["simple"]
 
 	for sent_id, sent in enumerate(list_text):
 		if len(sent) < 1: #for some reason, there are some blank "sentences" in the output (at the end of each document)
@@ -848,8 +1961,46 @@ def print_vertical(list_text,ordered_output = "simple"):
 					out_list.append(token[attr]) #add these to the list
 			print("\n" + "\t".join(out_list))
 
+def xml_data(data): #escapes text and attribute values the same way as minidom's toprettyxml()
+	return(data.replace("&","&amp;").replace("<","&lt;").replace("\"","&quot;").replace(">","&gt;"))
+
+def xml_leaf(indent,tag,text = None,attributes = []): #one element without child elements, formatted like prettify() output. attributes = list of (name, value)
+	start = indent + "<" + tag + "".join([" " + name + "=\"" + xml_data(value) + "\"" for name, value in attributes])
+	if text == None or text == "":
+		return(start + "/>\n")
+	return(start + ">" + xml_data(text.replace("\r\n","\n").replace("\r","\n")) + "</" + tag + ">\n") #line breaks are normalized by the xml parser in prettify()
+
+def write_xml(list_text,outf): #streaming version of output_xml(); writes the same text as prettify() one word at a time (without building the xml tree)
+	LGR_attr_list = ['main_tag','spec_tag1','spec_tag2','spec_tag3','spec_tag4','spec_tag5','spec_tag6','semantic_tag1','semantic_tag2'] #LGR specific tags
+	indent = "    "
+	outf.write('<?xml version="1.0" ?>\n')
+	if len(list_text) == 0:
+		outf.write("<tagged_text/>\n")
+		return
+	outf.write("<tagged_text>\n")
+	for sent_id, sent in enumerate(list_text):
+		outf.write(indent + '<sentence sent_id="' + str(sent_id) + '">\n')
+		outf.write(xml_leaf(indent * 2,"sentence_text"," ".join([item["word"] for item in sent])))
+		for item in sent:
+			outf.write(indent * 2 + '<word idx="' + xml_data(item["idx"]) + '">\n')
+			outf.write(xml_leaf(indent * 3,"raw",item["word"]))
+			outf.write(xml_leaf(indent * 3,"lemma",item["lemma"]))
+			outf.write(xml_leaf(indent * 3,"biber_tags",attributes = [(x,item[x]) for x in LGR_attr_list if item[x] != None]))
+			outf.write(xml_leaf(indent * 3,"UPOS",item["pos"]))
+			outf.write(xml_leaf(indent * 3,"POS",item["tag"]))
+			outf.write(xml_leaf(indent * 3,"DEP",item["dep_rel"],[("head",item["head"]),("head_id",str(item["head idx"]))]))
+			outf.write(indent * 2 + "</word>\n")
+		outf.write(indent + "</sentence>\n")
+	outf.write("</tagged_text>\n")
+
 def output_xml(list_text,outname = False,xml_element = None):
 	LGR_attr_list = ['main_tag','spec_tag1','spec_tag2','spec_tag3','spec_tag4','spec_tag5','spec_tag6','semantic_tag1','semantic_tag2'] #LGR specific tags
+	if outname != False and xml_element == None: #write the file directly (same output as building the tree and using prettify(), but memory use does not grow with the size of the document)
+		outf = open(outname,"w")
+		write_xml(list_text,outf)
+		outf.flush()
+		outf.close()
+		return
 	if xml_element == None: #set xml_element if needed
 		xml_element = ET.Element("tagged_text") #set root node in XML representation
 	
@@ -908,10 +2059,71 @@ def sent_exampler(list_text,target):
 			outl.append(" ".join(s_text))
 	return(outl)
 							
-def LGR_Full(filenames,outname,indices_dict=index_list,cats_d = cats, outdirname = "", output = None): #output options should be list ["xml","vertical"]
-	noNorm = ["nwords","wrd_length","mean_nominal_deps","relcl_nominal","amod_nominal","det_nominal","prep_nominal","poss_nominal","cc_nominal","mean_verbal_deps","mlc","mltu","dc_c","ccomp_c","relcl_c","infinitive_prop","nonfinite_prop"]
-	outf = open(outname,"w")#create output file
-	outf.write("filename,"+",".join(indices_dict)) #write header
+### corpus processing ###
+full_noNorm = ["nwords","wrd_length","mean_nominal_deps","relcl_nominal","amod_nominal","det_nominal","prep_nominal","poss_nominal","cc_nominal","mean_verbal_deps","mlc","mltu","dc_c","ccomp_c","relcl_c","infinitive_prop","nonfinite_prop"] #indices that are not normed by 10,000 words in LGR_Full() output
+
+def file_list(filenames): #allow filenames to be a list OR a target folder name/glob search
+	if type(filenames) == str:
+		if "*" not in filenames and filenames[-1] != "/": #if users forgot to include the "/"
+			filenames = filenames + "/*.txt"
+		if filenames[-1] == "/":
+			filenames = filenames + "*.txt"
+		filenames = glob.glob(filenames)
+	return(filenames)
+
+def results_row(simple_fname,tag_output,indices_dict=index_list): #list of values for one line of LGR_Full() output
+	output_list = [simple_fname]
+	for x in indices_dict:
+		if x in full_noNorm:
+			output_list.append(str(tag_output[x]))
+		else:
+			output_list.append(str((tag_output[x]/tag_output["nwords"])*10000)) #normed by 10,000 words
+	return(output_list)
+
+def corpus_worker_init(config,cache_dir = None): #runs once in each LGR_Full() worker process: load the model a single time
+	configure_nlp(**config)
+	if cache_dir == None: #with a parse cache, the model is only loaded if a text is not in the cache
+		load_nlp()
+
+def corpus_worker(task): #analyzes one shard of files for LGR_Full()
+	shard, indices_dict, cats_d, keep_tagged, batch_size, cache_dir, token_budget, chunk_size = task
+	results = [None] * len(shard) #(filename, row, tagged_text, error) for each file, in shard order
+	texts = []
+	for position, filename in enumerate(shard):
+		try:
+			texts.append((open(filename).read(),position))
+		except Exception as e:
+			results[position] = (filename,None,None,repr(e))
+	for tag_output, position, error in LGR_Safe_Batch(texts,indices_dict,cats_d,batch_size = batch_size,cache_dir = cache_dir,output = keep_tagged,token_budget = token_budget,sort_size = len(shard),chunk_size = chunk_size):
+		filename = shard[position]
+		if error == None:
+			try:
+				row = results_row(filename.split("/")[-1],tag_output,indices_dict)
+			except Exception as e:
+				error = repr(e)
+		if error != None:
+			results[position] = (filename,None,None,error)
+		elif keep_tagged == True:
+			results[position] = (filename,row,tag_output["tagged_text"],None)
+		else:
+			results[position] = (filename,row,None,None)
+	return(results)
+
+def annotation_filenames(simple_fname,outdirname = ""): #xml and vertical output filenames for an input file
+	base_name = "".join(simple_fname.split(".")[:-1]) #format filename
+	return((outdirname + "xml_output/" + base_name + ".xml",outdirname + "vertical_output/" + base_name + ".tsv"))
+
+def write_corpus_results(results,outname,indices_dict=index_list,outdirname = "",output = None,checkpoint_every = None,append = False):
+	"""Write LGR_Full()-style output. results = iterable of (filename, row, tagged_text, error) tuples (see corpus_worker()).
+	checkpoint_every = if set, the output is flushed to disk every checkpoint_every files and the completed files are recorded in a checkpoint file (see resume_plan()). The checkpoint file is removed when all results have been written.
+	append = if True, rows are added to an existing output file (used when resuming a run)
+	Returns a list of (filename, error) tuples for files that could not be processed.
+	"""
+	if append == True:
+		outf = open(outname,"a")
+	else:
+		outf = open(outname,"w")#create output file
+		outf.write("filename,"+",".join(indices_dict)) #write header
 	if output != None: # if user specifies output type:
 		if "xml" in output:
 			xmldir = outdirname + "xml_output/"
@@ -921,93 +2133,699 @@ def LGR_Full(filenames,outname,indices_dict=index_list,cats_d = cats, outdirname
 			vertdir = outdirname + "vertical_output/" 
 			if os.path.exists(vertdir) == False: #if the folder doesn't exist, make it
 				os.mkdir(vertdir)
+	if checkpoint_every != None:
+		checkf = open(checkpoint_filename(outname),"a")
+	completed = [] #checkpoint lines for files completed since the last checkpoint
 
-	if type(filenames) == str: #allow filenames to be a list OR a target folder name/glob search
-		if "*" not in filenames and filenames[-1] != "/": #if users forgot to include the "/"
-			filenames = filenames + "/*.txt"
-		if filenames[-1] == "/":
-			filenames = filenames + "*.txt"
-		filenames = glob.glob(filenames)
-	
-	for filename in filenames:
+	def save_checkpoint(): #results (and annotation files) are on disk before the files are recorded as completed
+		outf.flush()
+		os.fsync(outf.fileno())
+		checkf.write("".join(completed))
+		checkf.flush()
+		os.fsync(checkf.fileno())
+		del completed[:]
+
+	failed = []
+	for filename, output_list, tagged_text, error in results:
 		simple_fname = filename.split("/")[-1] #grab the filename without all preceding folders
 		print(simple_fname)
-		text = open(filename).read()
-		tag_output = LGR_Analysis(text,indices_dict,cats_d)
-		output_list = [simple_fname]
-		for x in indices_dict:
-			if x in noNorm:
-				output_list.append(str(tag_output[x]))
-			else:
-				output_list.append(str((tag_output[x]/tag_output["nwords"])*10000)) #normed by 10,000 words
-		outf.write("\n" + ",".join(output_list))
+		if error != None:
+			print("Warning! The file <<<",simple_fname,">>> could not be processed and was skipped:",error)
+			failed.append((filename,error))
+			completed.append("\t".join(["failed",filename,error.replace("\n"," ").replace("\t"," ")]) + "\n")
+		else:
+			outf.write("\n" + ",".join(output_list))
+
+			#output annotated files
+			if output != None and tagged_text != None: #tagged_text is None for rows that are reused from a previous run (incremental mode)
+				xmloutname, vertoutname = annotation_filenames(simple_fname,outdirname)
+				#output xml
+				if "xml" in output:
+					output_xml(tagged_text,xmloutname,xml_element = None)
+				#output vertical
+				if "vertical" in output:
+					output_vertical(tagged_text,vertoutname,ordered_output = "full") #write vertical output to file
+			completed.append("\t".join(["done",filename]) + "\n")
+		if checkpoint_every != None and len(completed) >= checkpoint_every:
+			save_checkpoint()
+	outf.flush()
+	outf.close()
+	if checkpoint_every != None: #the run is finished, so the checkpoint is no longer needed
+		checkf.close()
+		os.remove(checkpoint_filename(outname))
+	return(failed)
 
-		#output annotated files
-		if output != None:
-			#output xml
-			if "xml" in output:
-				xmloutname = xmldir + "".join(simple_fname.split(".")[:-1]) + ".xml" #format filename
-				output_xml(tag_output["tagged_text"],xmloutname,xml_element = None)
-			#output vertical
-			if "vertical" in output:
-				vertoutname = vertdir + "".join(simple_fname.split(".")[:-1]) + ".tsv" #format filename
-				output_vertical(tag_output["tagged_text"],vertoutname,ordered_output = "full") #write vertical output to file
+### Checkpoints (LGR_Full(resume = True)) ###
+#While LGR_Full() runs, completed files are recorded in outname + ".checkpoint" (one "done" or "failed" line per file, in file order).
+
+def checkpoint_filename(outname):
+	return(outname + ".checkpoint")
+
+def resume_plan(outname,indices_dict=index_list):
+	"""Prepare to resume an interrupted LGR_Full() run.
+	Rows that were written after the last checkpoint (including a partial last row) are removed from outname.
+	Returns ({filename : error (None for completed files)}, for each file recorded in the checkpoint). If there is nothing to resume, an empty dictionary is returned.
+	"""
+	if os.path.exists(checkpoint_filename(outname)) == False or os.path.exists(outname) == False:
+		print("No checkpoint was found for <<<",outname,">>>. Starting a new run.")
+		return({})
+	recorded = {}
+	done_names = []
+	for line in open(checkpoint_filename(outname)).read().split("\n"):
+		values = line.split("\t")
+		if len(values) == 2 and values[0] == "done":
+			recorded[values[1]] = None
+			done_names.append(values[1].split("/")[-1])
+		elif len(values) == 3 and values[0] == "failed":
+			recorded[values[1]] = values[2]
+	lines = open(outname).read().split("\n")
+	kept = lines[1:len(done_names) + 1]
+	if lines[0] != "filename,"+",".join(indices_dict) or [x.split(",")[0] for x in kept] != done_names:
+		print("Warning! The checkpoint for <<<",outname,">>> does not match the output file. Starting a new run.")
+		return({})
+	outf = open(outname + ".tmp","w")
+	outf.write("\n".join([lines[0]] + kept))
 	outf.flush()
 	outf.close()
+	os.replace(outname + ".tmp",outname)
+	return(recorded)
+
+def LGR_Full(filenames,outname,indices_dict=index_list,cats_d = cats, outdirname = "", output = None, batch_size = None, jobs = 1, shard_size = 32, cache_dir = None, incremental = False, checkpoint_every = 100, resume = False, token_budget = None, chunk_size = None): #output options should be list ["xml","vertical"]
+	"""Analyze a list of files (or a folder name) and write one line of indices per file to outname.
+	batch_size = number of texts sent to nlp.pipe() at a time
+	token_budget = if set, the texts in each shard are sorted by length and parsed in batches of at most token_budget tokens (including padding) instead of batch_size texts (see token_batches()). Rows are still written in the original file order.
+	chunk_size = texts that are longer than this (default = max_length) are parsed in chunks (see LGR_Analysis())
+	jobs = number of worker processes. Each worker loads the model once and analyzes shards of shard_size files. Output is always written in the original file order.
+	cache_dir = optional folder for cached parses. Texts that are already in the cache are not re-parsed (useful when only the rules or word lists have changed).
+	incremental = if True, only new or changed files are analyzed (see incremental_plan()). Rows for unchanged files are copied from the previous results, and results/annotations for files that are no longer in the list are removed.
+	checkpoint_every = number of files between checkpoints (results are flushed to disk and completed files are recorded in outname + ".checkpoint"). None = no checkpoints.
+	resume = if True, an interrupted run is continued from its last checkpoint (completed files are not processed again and no rows are duplicated). The other arguments should be the same as in the interrupted run.
+	A file that cannot be processed is reported and skipped (it does not stop the run). Returns a list of (filename, error) tuples for skipped files.
+	"""
+	filenames = file_list(filenames)
+	recorded = {} #filename -> error (None if completed) for files completed before the run was interrupted
+	if resume == True:
+		recorded = resume_plan(outname,indices_dict)
+	elif checkpoint_every != None and os.path.exists(checkpoint_filename(outname)):
+		os.remove(checkpoint_filename(outname)) #old checkpoint from an interrupted run that is not being resumed
+	reuse = {} #filename -> results row from the previous run (incremental mode)
+	if incremental == True:
+		reuse, signatures, manifest_header = incremental_plan(filenames,outname,indices_dict,outdirname,output)
+		outname_previous = outname + ".previous"
+	to_analyze = [x for x in filenames if x not in reuse and x not in recorded]
+	tasks = ((to_analyze[i:i + shard_size],indices_dict,cats_d,output != None,batch_size,cache_dir,token_budget,chunk_size) for i in range(0,len(to_analyze),shard_size))
+	if jobs > 1:
+		pool = multiprocessing.Pool(jobs,initializer = corpus_worker_init,initargs = (dict(nlp_config),cache_dir))
+		shard_results = pool.imap(corpus_worker,tasks) #imap returns shards in the original order
+	else:
+		pool = None
+		shard_results = map(corpus_worker,tasks)
+	analyzed = (result for shard_result in shard_results for result in shard_result)
+	def results(): #rows in the original file order (reused or newly analyzed)
+		for filename in filenames:
+			if filename in recorded:
+				continue
+			elif filename in reuse:
+				yield((filename,reuse[filename],None,None))
+			else:
+				yield(next(analyzed))
+	try:
+		failed = [(x,recorded[x]) for x in filenames if x in recorded and recorded[x] != None] #failures before the run was interrupted
+		failed += write_corpus_results(results(),outname,indices_dict,outdirname,output,checkpoint_every = checkpoint_every,append = len(recorded) > 0)
+	finally:
+		if pool != None:
+			pool.terminate()
+	if incremental == True: #record the files that are now up to date
+		failed_names = set([x[0] for x in failed])
+		write_manifest(manifest_filename(outname),manifest_header,[(x,signatures[x]) for x in filenames if x not in failed_names])
+		if os.path.exists(outname_previous):
+			os.remove(outname_previous)
+	return(failed)
+
+### Incremental processing (LGR_Full(incremental = True)) ###
+#A manifest (outname + ".manifest") records the path, size, modification time, content hash, and TAASSC version for each processed file.
+manifest_columns = ["path","size","mtime","sha1","version"]
+
+def manifest_filename(outname):
+	return(outname + ".manifest")
+
+def file_signature(filename,old_signature = None): #size, mtime, and content hash for a file. The hash is copied from old_signature if size and mtime have not changed
+	stat = os.stat(filename)
+	signature = {"size" : str(stat.st_size), "mtime" : str(stat.st_mtime_ns), "version" : version}
+	if old_signature != None and old_signature["size"] == signature["size"] and old_signature["mtime"] == signature["mtime"]:
+		signature["sha1"] = old_signature["sha1"]
+	else:
+		with open(filename,"rb") as inf:
+			signature["sha1"] = hashlib.sha1(inf.read()).hexdigest()
+	return(signature)
+
+def read_manifest(fname): #returns (header, {path : signature})
+	header = None
+	entries = {}
+	if os.path.exists(fname) == False:
+		return((header,entries))
+	for line in open(fname).read().split("\n"):
+		if line == "":
+			continue
+		if line[0] == "#":
+			header = line
+			continue
+		values = line.split("\t")
+		entries[values[0]] = dict(zip(manifest_columns[1:],values[1:]))
+	return((header,entries))
+
+def write_manifest(fname,header,entries): #entries = list of (path, signature) tuples
+	outf = open(fname + ".tmp","w")
+	outf.write(header)
+	for path, signature in entries:
+		outf.write("\n" + "\t".join([path] + [signature[x] for x in manifest_columns[1:]]))
+	outf.flush()
+	outf.close()
+	os.replace(fname + ".tmp",fname)
+
+def read_results_rows(fname): #returns (header, {simple filename : row}) for an LGR_Full() output file
+	lines = open(fname).read().split("\n")
+	rows = {}
+	for line in lines[1:]:
+		if line != "":
+			rows[line.split(",")[0]] = line.split(",")
+	return((lines[0],rows))
+
+def incremental_plan(filenames,outname,indices_dict=index_list,outdirname = "",output = None):
+	"""Decide which files need to be analyzed in an incremental LGR_Full() run.
+	A file is reused if it is in the manifest with the same content hash (the hash is only recomputed if the size or modification time changed) and TAASSC version, and its row is in the previous results.
+	Everything is recomputed if the index list or the output options changed. Annotation files for files that are no longer in the list are deleted.
+	Returns ({filename : previous row}, {filename : signature}, manifest header).
+	"""
+	manifest_header = "#" + "\t".join(["indices=" + hashlib.sha1(",".join(indices_dict).encode("utf-8")).hexdigest(),"output=" + ",".join(sorted(output or [])),"columns=" + ",".join(manifest_columns)])
+	old_header, old_entries = read_manifest(manifest_filename(outname))
+	#the previous results are moved to outname + ".previous" until the run is finished (if that file exists, a previous incremental run did not finish)
+	outname_previous = outname + ".previous"
+	if os.path.exists(outname) and os.path.exists(outname_previous) == False:
+		os.replace(outname,outname_previous)
+	old_rows = {}
+	if os.path.exists(outname_previous):
+		results_header, old_rows = read_results_rows(outname_previous)
+		if results_header != "filename,"+",".join(indices_dict):
+			old_rows = {}
+	if old_header != manifest_header:
+		old_entries = {}
+
+	reuse = {}
+	signatures = {}
+	for filename in filenames:
+		old_signature = old_entries.get(filename)
+		signatures[filename] = file_signature(filename,old_signature)
+		simple_fname = filename.split("/")[-1] #grab the filename without all preceding folders
+		if old_signature != None and old_signature["sha1"] == signatures[filename]["sha1"] and old_signature["version"] == version and simple_fname in old_rows:
+			reuse[filename] = old_rows[simple_fname]
+
+	#remove annotations for files that were deleted from the corpus
+	current = set(filenames)
+	current_simple = set([x.split("/")[-1] for x in filenames])
+	for filename in old_entries:
+		if filename not in current and filename.split("/")[-1] not in current_simple:
+			for annotation_name in annotation_filenames(filename.split("/")[-1],outdirname):
+				if os.path.exists(annotation_name):
+					os.remove(annotation_name)
+	return((reuse,signatures,manifest_header))
+
+### Two-stage processing: parse a corpus once (LGR_Parse), then tag it as many times as needed (LGR_Tag) ###
+#A parsed-corpus store is a folder with DocBin shards (tokens, lemmas, POS, tags, dependencies, heads) and an index file.
+#LGR_Tag() does not load the spacy model, so rules and index lists can be changed and re-run cheaply (e.g., on a laptop).
+store_index_name = "store_index.tsv" #filename \t shard file \t position in shard (in original file order)
+
+def parse_worker(task): #parses one shard of files and saves it to the store as a single DocBin file (used by LGR_Parse)
+	shard, storedir, shard_name, batch_size, cache_dir, chunk_size = task
+	results = [None] * len(shard) #(filename, position in DocBin, error) for each file
+	texts = []
+	long_texts = [] #(cleaned text, position) for texts that are longer than chunk_size
+	for position, filename in enumerate(shard):
+		try:
+			text = clean_text(open(filename).read())
+			if len(text) > chunk_size:
+				long_texts.append((text,position))
+			else:
+				texts.append((text,position))
+		except Exception as e:
+			results[position] = (filename,None,repr(e))
+	doc_bin = DocBin(attrs = cache_attrs)
+	for text, position in long_texts: #parsed in chunks and stored as one Doc (the store has one Doc per file)
+		try:
+			doc = Doc.from_docs(list(chunk_docs(split_text(text,chunk_size),cache_dir)),ensure_whitespace = False)
+			results[position] = (shard[position],len(doc_bin),None)
+			doc_bin.add(doc)
+		except Exception as e:
+			results[position] = (shard[position],None,repr(e))
+	for group in text_groups(texts,batch_size):
+		docs = parse_texts([text for text,position in group],batch_size,cache_dir)
+		for doc, (text,position) in zip(docs,group):
+			if isinstance(doc,Exception):
+				results[position] = (shard[position],None,repr(doc))
+			else:
+				results[position] = (shard[position],len(doc_bin),None)
+				doc_bin.add(doc)
+	doc_bin.to_disk(os.path.join(storedir,shard_name))
+	return(results)
+
+def LGR_Parse(filenames,storedir,batch_size = None,jobs = 1,shard_size = 256,cache_dir = None,chunk_size = None):
+	"""Parse a list of files (or a folder name) and save the parses to a parsed-corpus store (storedir) that can be tagged with LGR_Tag().
+	jobs = number of worker processes (each worker loads the model once and parses shards of shard_size files)
+	chunk_size = texts that are longer than this (default = max_length) are parsed in chunks (see split_text()) that are joined into one Doc before they are stored
+	Returns a list of (filename, error) tuples for files that could not be parsed.
+	"""
+	filenames = file_list(filenames)
+	if chunk_size == None:
+		chunk_size = nlp_config["max_length"]
+	if os.path.exists(storedir) == False:
+		os.makedirs(storedir)
+	tasks = ((filenames[i:i + shard_size],storedir,"shard_" + str(i // shard_size).zfill(6) + ".spacy",batch_size,cache_dir,chunk_size) for i in range(0,len(filenames),shard_size))
+	if jobs > 1:
+		pool = multiprocessing.Pool(jobs,initializer = corpus_worker_init,initargs = (dict(nlp_config),cache_dir))
+		shard_results = pool.imap(parse_worker,tasks)
+	else:
+		pool = None
+		shard_results = map(parse_worker,tasks)
+	failed = []
+	outf = open(os.path.join(storedir,store_index_name),"w")
+	outf.write("#" + model_signature()) #record which model produced the parses
+	try:
+		for shard_number, shard_result in enumerate(shard_results):
+			for filename, position, error in shard_result:
+				print(filename.split("/")[-1])
+				if error != None:
+					print("Warning! The file <<<",filename.split("/")[-1],">>> could not be parsed and was skipped:",error)
+					failed.append((filename,error))
+				else:
+					outf.write("\n" + "\t".join([filename,"shard_" + str(shard_number).zfill(6) + ".spacy",str(position)]))
+	finally:
+		if pool != None:
+			pool.terminate()
+		outf.flush()
+		outf.close()
+	return(failed)
+
+def load_store(storedir):
+	"""Yields (filename, Doc) tuples from a parsed-corpus store in the original file order (one shard is in memory at a time). Does not load the spacy model."""
+	entries = [] #(filename, position) tuples for the current shard
+	current_shard = None
+	for line in open(os.path.join(storedir,store_index_name)).read().split("\n"):
+		if line == "" or line[0] == "#":
+			continue
+		filename, shard_name, position = line.split("\t")
+		if shard_name != current_shard:
+			yield from store_shard_docs(storedir,current_shard,entries)
+			current_shard = shard_name
+			entries = []
+		entries.append((filename,int(position)))
+	yield from store_shard_docs(storedir,current_shard,entries)
+
+def store_shard_docs(storedir,shard_name,entries): #helper for load_store()
+	if len(entries) == 0:
+		return
+	docs = list(DocBin().from_disk(os.path.join(storedir,shard_name)).get_docs(parsed_vocab()))
+	for filename, position in entries:
+		yield((filename,docs[position]))
+
+def LGR_Tag(storedir,outname,indices_dict=index_list,cats_d = cats, outdirname = "", output = None):
+	"""Tag a parsed-corpus store created by LGR_Parse() and write LGR_Full()-style output (without loading the spacy model).
+	Returns a list of (filename, error) tuples for files that could not be tagged.
+	"""
+	def results():
+		for filename, doc in load_store(storedir):
+			try:
+				tag_output = LGR_Doc_Analysis(doc,indices_dict,cats_d,output != None)
+				yield((filename,results_row(filename.split("/")[-1],tag_output,indices_dict),tag_output["tagged_text"],None))
+			except Exception as e:
+				yield((filename,None,None,repr(e)))
+	return(write_corpus_results(results(),outname,indices_dict,outdirname,output))
 
 ### process fix-tagged xml files
-### Still need to deal with wrd_length and mattr. This will require tweaking the calcFromXml() function ###
-
-#work on xmlreader
-def calcFromXml(xml_filename,indices_dict=index_list):
-	simplefilename = xml_filename.split("/")[-1]
+#Tag counts are read from the (hand-corrected) biber_tags. The indices that are not tags (word counts, MATTR, noun phrase and clausal complexity)
+#are recalculated from the words, lemmas, pos, and dependency relations in the file (no spaCy model is needed).
+
+def xml_phrasal_verb(token,feature_dict): #all_phrasal_verbs is not written to the xml files (it is main_tag2), so it is recalculated from the dependency structure
+	counts = collections.defaultdict(int)
+	semantic_analysis_verb(token,{},counts)
+	feature_dict["all_phrasal_verbs"] += counts["all_phrasal_verbs"]
+
+xml_rules = [rule for rule in lgr_rules if rule["name"] in ["wrd_nchar","noun_phrase_complexity","clausal_complexity"]] + [
+	{"name" : "xml_phrasal_verb", "indices" : ["all_phrasal_verbs"],
+		"pos" : ["VERB"],
+		"function" : lambda token,w_count,views,sent,token_d,feature_dict: xml_phrasal_verb(token,feature_dict)}]
+xml_dispatch = dispatch_table(xml_rules,output = False)
+xml_indices = set([x for rule in xml_rules for x in rule["indices"]]) #indices that are recalculated instead of counted from biber_tags
+
+def xml_word(elem): #(idx, word, lemma, UPOS, POS, DEP, head_id) for a <word> element (see output_xml())
+	dep = elem.find("DEP")
+	if dep == None:
+		dep = ET.Element("DEP")
+	return((elem.get("idx"),elem.findtext("raw") or "",elem.findtext("lemma") or "",elem.findtext("UPOS") or "",elem.findtext("POS") or "",dep.text or "",dep.get("head_id")))
+
+def xml_views(words): #TokenViews for one sentence of xml_word() tuples. Heads are linked within the sentence (a head that is not in the sentence is treated as a root)
+	position = dict([(word[0],n) for n, word in enumerate(words)])
+	views = [TokenView(raw,raw.lower(),lemma,lemma.lower(),upos,tag,dep,n) for n, (idx,raw,lemma,upos,tag,dep,head_id) in enumerate(words)]
+	return(link_views(views,[position.get(word[6],n) for n, word in enumerate(words)]))
+
+def xml_sentence(words,index_dict): #applies xml_rules to one sentence
+	views = xml_views(words)
+	for w_count, token in enumerate(views):
+		for function, vector_name in token_rules(token,xml_dispatch):
+			function(token,w_count,views,views,{},index_dict)
+
+def recalc_start(indices_dict,mattr_window = 50): #index dictionary for calcFromXml()/calcFromVertical()
 	index_dict = {}
 	for x in indices_dict:
 		index_dict[x] = 0 #start index counts
-	tree = ET.parse(xml_filename)
-	root = tree.getroot()
-	for tags in root.iter("biber_tags"): #all biber tags are listed as tag attributes (e.g., <biber_tags main_tag="verb" spec_tag1="non_past_tense" semantic_tag1="mental_verb"/>)
-		if len(tags.attrib) > 0:
-			for x in tags.attrib:
-				feature = tags.attrib[x]
-				if feature in index_dict:
-					index_dict[feature] += 1
-				else:
-					print("Warning! the tag <<<",feature,">>> is not a recognized tag. This may be due to typos in the tag-fixed files. Please double check the file <<<", simplefilename,">>>")
-	for upos in root.iter("UPOS"): #all pos are listed as text within tags (e.g., <UPOS>NOUN</UPOS>)
-		if upos.text not in ["PUNCT","SYM","SPACE","X"]:
-			index_dict["nwords"] += 1
-	
+	for x in xml_indices:
+		index_dict[x] = 0
+	index_dict["mattr"] = MattrWindow(mattr_window)
+	index_dict["lemma_text"] = None
+	return(index_dict)
+
+def recalc_finish(index_dict): #ratios, etc.
+	for x in derived_indices:
+		if x in index_dict:
+			index_dict[x] = derived_indices[x][0](index_dict)
 	return(index_dict)
 
+def count_tag(feature,index_dict,simplefilename): #adds one to the count for a tag in a fix-tagged file
+	if feature in xml_indices: #recalculated
+		return
+	elif feature in index_dict:
+		index_dict[feature] += 1
+	else:
+		print("Warning! the tag <<<",feature,">>> is not a recognized tag. This may be due to typos in the tag-fixed files. Please double check the file <<<", simplefilename,">>>")
+
+def xml_sentences(xml_filename): #yields the xml_word() tuples and biber tags for each sentence in a fix-tagged xml file
+	words = [] #xml_word() tuples for the current sentence
+	tags = [] #biber tags for the current sentence
+	for event, elem in ET.iterparse(xml_filename): #the file is read incrementally, and each element is seen once it is complete
+		if elem.tag == "biber_tags": #all biber tags are listed as tag attributes (e.g., <biber_tags main_tag="verb" spec_tag1="non_past_tense" semantic_tag1="mental_verb"/>)
+			tags += [elem.attrib[x] for x in elem.attrib]
+		elif elem.tag == "word":
+			words.append(xml_word(elem))
+			elem.clear() #read elements are discarded (memory use does not depend on file size)
+		elif elem.tag == "sentence":
+			yield((words,tags))
+			words = []
+			tags = []
+			elem.clear()
+	if len(words) > 0 or len(tags) > 0: #words that are not in a sentence
+		yield((words,tags))
+
+def calcFromXml(xml_filename,indices_dict=index_list,mattr_window = 50):
+	"""Calculates indices for a fix-tagged xml file (see output_xml()). Tags are counted from biber_tags; the other indices are calculated from
+	the words, lemmas, pos, and dependency relations (see xml_rules). mattr uses the (lowercase) lemmas in the file.
+	"""
+	simplefilename = xml_filename.split("/")[-1]
+	index_dict = recalc_start(indices_dict,mattr_window)
+	for words, tags in xml_sentences(xml_filename):
+		for feature in tags:
+			count_tag(feature,index_dict,simplefilename)
+		xml_sentence(words,index_dict)
+	
+	return(recalc_finish(index_dict))
+
+### process fix-tagged vertical files
+penn_upos = {"AFX" : "ADJ", "CC" : "CCONJ", "CD" : "NUM", "DT" : "DET", "EX" : "PRON", "IN" : "ADP", "JJ" : "ADJ", "JJR" : "ADJ", "JJS" : "ADJ",
+	"NN" : "NOUN", "NNS" : "NOUN", "NNP" : "PROPN", "NNPS" : "PROPN", "PDT" : "DET", "POS" : "PART", "PRP" : "PRON", "PRP$" : "PRON",
+	"RB" : "ADV", "RBR" : "ADV", "RBS" : "ADV", "RP" : "ADP", "TO" : "PART", "UH" : "INTJ", "VB" : "VERB", "VBD" : "VERB", "VBG" : "VERB",
+	"VBN" : "VERB", "VBP" : "VERB", "VBZ" : "VERB", "WDT" : "DET", "WP" : "PRON", "WP$" : "PRON", "WRB" : "ADV",
+	"." : "PUNCT", "," : "PUNCT", ":" : "PUNCT", "``" : "PUNCT", "''" : "PUNCT", "-LRB-" : "PUNCT", "-RRB-" : "PUNCT", "HYPH" : "PUNCT", "NFP" : "PUNCT",
+	"$" : "SYM", "#" : "SYM", "SYM" : "SYM", "_SP" : "SPACE"} #Penn tag -> Universal POS (following spaCy's English tag map; other tags are X)
+
+def tag_upos(tag,dep,lemma): #Universal POS for vertical files without a pos column ("simple" format). Follows spaCy for auxiliaries (modals, auxiliaries, and "be"), indefinite pronouns, and "not"
+	if tag == "MD" or (tag in ["VB","VBD","VBG","VBN","VBP","VBZ"] and (dep in ["aux","auxpass"] or lemma == "be")):
+		return("AUX")
+	elif tag == "NN" and lemma in indefinite_set:
+		return("PRON")
+	elif tag == "RB" and lemma in ["not","n't"]:
+		return("PART")
+	return(penn_upos.get(tag,"X"))
+
+def vertical_sentences(filename,ordered_output = "full"): #yields a list of rows (lists of column values) for each sentence in a vertical file (see output_vertical()). The file is read one line at a time
+	n_columns = len(vertical_formats[ordered_output])
+	rows = []
+	record = None #text of the current token (tokens that include line breaks span several lines)
+	for line in open(filename,newline = "\n"):
+		if line.endswith("\n"):
+			line = line[:-1]
+		if record != None and record.count("\t") < n_columns - 1 and record.rsplit("\t",1)[-1].strip() == "" and line.split("\t",1)[0].strip() == "": #the line break is part of a whitespace token (word, lemma, or head; the text before and after it is whitespace). Other short rows are not joined to the next line (see vertical_words())
+			record += "\n" + line
+			continue
+		if record != None:
+			rows.append(record.split("\t"))
+			record = None
+		if line.startswith("#sentence"):
+			if len(rows) > 0:
+				yield(rows)
+			rows = []
+		elif line != "": #sentences are separated by blank lines
+			record = line
+	if record != None:
+		rows.append(record.split("\t"))
+	if len(rows) > 0:
+		yield(rows)
+
+def vertical_words(vert_filename,ordered_output = "full"): #yields the xml_word() tuples and biber tags for each sentence in a fix-tagged vertical file (like xml_sentences())
+	simplefilename = vert_filename.split("/")[-1]
+	columns = vertical_formats[ordered_output]
+	tag_columns = [n for n, x in enumerate(columns) if x in cats] #main_tag, spec_tag1, etc.
+	for rows in vertical_sentences(vert_filename,ordered_output):
+		words = [] #same format as xml_word()
+		tags = []
+		for row in rows:
+			if len(row) != len(columns):
+				print("Warning! a line with",len(row),"columns (instead of",len(columns),") was skipped. Please double check the file <<<", simplefilename,">>>")
+				continue
+			token = dict(zip(columns,row))
+			if "pos" in token:
+				upos = token["pos"]
+			else:
+				upos = tag_upos(token["tag"],token["dep_rel"],token["lemma"])
+			words.append((token["idx"],token["word"],token["lemma"],upos,token["tag"],token["dep_rel"],token["head idx"]))
+			tags += [row[n] for n in tag_columns if row[n] != "n/a"]
+		yield((words,tags))
+
+def calcFromVertical(vert_filename,indices_dict=index_list,ordered_output = "full",mattr_window = 50):
+	"""Calculates indices for a fix-tagged vertical file (see output_vertical(); ordered_output = "full" or "simple"), like calcFromXml().
+	"simple" files do not include Universal POS tags, so they are derived from the Penn tags (see tag_upos()).
+	"""
+	simplefilename = vert_filename.split("/")[-1]
+	index_dict = recalc_start(indices_dict,mattr_window)
+	for words, tags in vertical_words(vert_filename,ordered_output):
+		for feature in tags:
+			count_tag(feature,index_dict,simplefilename)
+		xml_sentence(words,index_dict)
+	
+	return(recalc_finish(index_dict))
+
+def recalc_worker(task): #calculates indices for one shard of fix-tagged files (see recalc_files())
+	shard, indices_dict, file_format = task
+	if file_format == "xml":
+		return([(filename,calcFromXml(filename,indices_dict)) for filename in shard])
+	return([(filename,calcFromVertical(filename,indices_dict,file_format)) for filename in shard])
+
 
-def lgrXml(filenames,outname,indices_dict=index_list):
+def lgrXml(filenames,outname,indices_dict=index_list,jobs = 1,shard_size = 64):
+	"""Calculate the indices for fix-tagged xml files (see calcFromXml()) and write one line per file to outname (same format as LGR_Full()).
+	jobs = number of worker processes (each worker counts shards of shard_size files). Output is always written in the original file order.
+	"""
+	recalc_files(filenames,outname,indices_dict,"xml",jobs,shard_size)
+
+def lgrVertical(filenames,outname,indices_dict=index_list,ordered_output = "full",jobs = 1,shard_size = 64):
+	"""Calculate the indices for fix-tagged vertical files (see calcFromVertical()) and write one line per file to outname (same format as lgrXml()).
+	ordered_output = column format of the files ("full" or "simple"; see output_vertical())
+	"""
+	recalc_files(filenames,outname,indices_dict,ordered_output,jobs,shard_size)
+
+def recalc_files(filenames,outname,indices_dict,file_format,jobs = 1,shard_size = 64): #file_format = "xml", "full", or "simple"
 	print(outname)
 	outf = open(outname,"w")#create output file
-	#need to deal with wrd_length and mattr. This will require tweaking the calcFromXml() function
-	ignoreL = ["wrd_length","mattr","np","np_deps","relcl_dep","amod_dep","det_dep","prep_dep","poss_dep","cc_dep","all_clauses","finite_clause","finite_ind_clause","finite_dep_clause","finite_compl_clause","finite_relative_clause","nonfinite_clause","vp_deps","mean_nominal_deps","relcl_nominal","amod_nominal","det_nominal","prep_nominal","poss_nominal","cc_nominal","mean_verbal_deps","mlc","mltu","dc_c","ccomp_c","relcl_c"]
-	index_list = [x for x in indices_dict if x not in ignoreL]
+	index_list = list(indices_dict)
 	outf.write("filename,"+",".join(index_list)) #write header
-	for filename in filenames:
-		tagDict = calcFromXml(filename,index_list)
-		simple_fname = filename.split("/")[-1] #grab the filename without all preceding folders
-		print(simple_fname)
-		output_list = [simple_fname]
-		for x in index_list:
-			if x in ["nwords","wrd_length"]:
-				output_list.append(str(tagDict[x]))
-			else:
-				output_list.append(str((tagDict[x]/tagDict["nwords"])*10000)) #normed by 10,000 words
-		outf.write("\n" + ",".join(output_list))
+	if jobs == 1:
+		shard_size = 1 #each file's row is written (and printed) right after the file is counted
+	tasks = ((filenames[i:i + shard_size],index_list,file_format) for i in range(0,len(filenames),shard_size))
+	if jobs > 1:
+		pool = multiprocessing.Pool(jobs)
+		shard_results = pool.imap(recalc_worker,tasks) #imap returns shards in the original order
+	else:
+		pool = None
+		shard_results = map(recalc_worker,tasks)
+	try:
+		for filename, tagDict in (result for shard_result in shard_results for result in shard_result):
+			write_recalc_row(outf,filename,tagDict,index_list)
+	finally:
+		if pool != None:
+			pool.terminate()
 	outf.flush()
 	outf.close()
 
+def write_recalc_row(outf,filename,tagDict,index_list): #one line of lgrXml()/lgrVertical() output
+	simple_fname = filename.split("/")[-1] #grab the filename without all preceding folders
+	print(simple_fname)
+	outf.write("\n" + ",".join(results_row(simple_fname,tagDict,index_list)))
+
+### re-tag xml or vertical files
+#Docs are rebuilt from the words, lemmas, pos, tags, and dependency relations in annotation files (e.g., after the parses were corrected by hand),
+#so that the TAASSC rules can be run again without the parser.
+
+def annotation_doc(sentences,vocab = None): #spacy Doc from the xml_word() tuples for each sentence (see xml_sentences() and vertical_words())
+	if vocab == None:
+		vocab = parsed_vocab()
+	words = []
+	heads = []
+	sent_starts = []
+	for sent_words, tags in sentences:
+		position = dict([(word[0],len(words) + n) for n, word in enumerate(sent_words)])
+		for n, word in enumerate(sent_words):
+			heads.append(position.get(word[6],len(words))) #a head that is not in the sentence is treated as a root (like xml_views())
+			sent_starts.append(n == 0)
+			words.append(word)
+	return(Doc(vocab,words = [word[1] or " " for word in words], #spacy does not allow empty words
+		lemmas = [word[2] for word in words],pos = [word[3] for word in words],tags = [word[4] for word in words],
+		deps = [word[5] for word in words],heads = heads,sent_starts = sent_starts))
+
+def xml_doc(xml_filename,vocab = None): #spacy Doc for a (fix-tagged) xml file
+	return(annotation_doc(xml_sentences(xml_filename),vocab))
+
+def vertical_doc(vert_filename,ordered_output = "full",vocab = None): #spacy Doc for a (fix-tagged) vertical file
+	return(annotation_doc(vertical_words(vert_filename,ordered_output),vocab))
+
+def LGR_Retag(filenames,outname,indices_dict=index_list,cats_d = cats,outdirname = "",output = None,file_format = "xml"):
+	"""Re-run the TAASSC rules on xml or vertical annotation files (file_format = "xml", "full", or "simple") and write LGR_Full()-style output.
+	Unlike lgrXml()/lgrVertical(), the biber tags in the files are ignored and all tags are assigned again from the (corrected) parses.
+	Returns a list of (filename, error) tuples for files that could not be tagged.
+	"""
+	if output != None: #new annotation files cannot replace the files that are being read
+		inputs = set([os.path.abspath(filename) for filename in filenames])
+		for filename in filenames:
+			xml_name, vert_name = annotation_filenames(filename.split("/")[-1],outdirname)
+			if ("xml" in output and os.path.abspath(xml_name) in inputs) or ("vertical" in output and os.path.abspath(vert_name) in inputs):
+				raise ValueError("LGR_Retag() output would overwrite " + filename + " (use a different outdirname)")
+	vocab = parsed_vocab()
+	def results():
+		for filename in filenames:
+			try:
+				if file_format == "xml":
+					doc = xml_doc(filename,vocab)
+				else:
+					doc = vertical_doc(filename,file_format,vocab)
+				tag_output = LGR_Doc_Analysis(doc,indices_dict,cats_d,output != None)
+				yield((filename,results_row(filename.split("/")[-1],tag_output,indices_dict),tag_output["tagged_text"],None))
+			except Exception as e:
+				yield((filename,None,None,repr(e)))
+	return(write_corpus_results(results(),outname,indices_dict,outdirname,output))
+
+### process pre-parsed CoNLL-U files
+#Sentences that were parsed by another pipeline are converted to spacy Docs (see annotation_doc()) and tagged without loading the spacy model.
+#The rules expect the labels of spaCy's English models (Penn tags in XPOS and ClearNLP-style dependency relations such as nsubjpass, dobj, and pobj).
+
+def conllu_sentences(conllu_filename): #yields (newdoc, xml_word() tuples) for each sentence in a CoNLL-U file (read one line at a time). newdoc = document id if the sentence starts a new document (otherwise None)
+	simplefilename = conllu_filename.split("/")[-1]
+	newdoc = None
+	words = []
+	for line in open(conllu_filename, encoding = "utf-8"):
+		line = line.rstrip("\r\n")
+		if line.startswith("#"):
+			if line[1:].strip().startswith("newdoc"): #"# newdoc" or "# newdoc id = ..."
+				if "=" in line:
+					newdoc = line.split("=",1)[1].strip()
+				else:
+					newdoc = ""
+			continue
+		if line.strip() == "": #end of sentence
+			if len(words) > 0:
+				yield((newdoc,words))
+				newdoc = None
+				words = []
+			continue
+		row = line.split("\t")
+		if len(row) != 10:
+			print("Warning! a line with",len(row),"columns (instead of 10) was skipped. Please double check the file <<<", simplefilename,">>>")
+			continue
+		if "-" in row[0] or "." in row[0]: #multiword tokens (e.g., "don't" = "do" + "n't") and empty nodes are skipped
+			continue
+		form, lemma, upos, xpos, head, deprel = [row[1]] + [x if x != "_" else "" for x in row[2:5]] + [row[6],row[7]]
+		if head == "0" or head == "_": #the root is its own head in spacy
+			head = row[0]
+		if deprel == "root":
+			deprel = "ROOT"
+		elif deprel == "_":
+			deprel = ""
+		if lemma == "" and row[2] == "_" and form == "_": #the word "_"
+			lemma = "_"
+		words.append((row[0],form,lemma,upos,xpos,deprel,head))
+	if len(words) > 0: #no blank line after the last sentence
+		yield((newdoc,words))
+
+def conllu_docs(conllu_filename,vocab = None):
+	"""Yields (document id, spacy Doc) for each document in a CoNLL-U file. Documents start with "# newdoc" comments (a file without them is a single document with the id None).
+	Document ids are taken from "# newdoc id = ..." comments (or numbered from 1). Only one document is held in memory at a time.
+	"""
+	if vocab == None:
+		vocab = parsed_vocab()
+	doc_id = None
+	n_docs = 0
+	sentences = []
+	for newdoc, words in conllu_sentences(conllu_filename):
+		if newdoc != None:
+			if len(sentences) > 0:
+				yield((doc_id,annotation_doc(sentences,vocab)))
+				sentences = []
+			n_docs += 1
+			doc_id = newdoc or str(n_docs)
+		sentences.append((words,[]))
+	if len(sentences) > 0:
+		yield((doc_id,annotation_doc(sentences,vocab)))
+
+def conllu_doc_name(conllu_filename,doc_id): #"filename" in the output for a document in a CoNLL-U file (e.g., "corpus_doc1.conllu")
+	if doc_id == None:
+		return(conllu_filename)
+	path, simple_fname = os.path.split(conllu_filename)
+	base_name, extension = os.path.splitext(simple_fname)
+	return(os.path.join(path,base_name + "_" + re.sub(r"[^\w-]","_",doc_id) + extension))
+
+def conllu_results(conllu_filename,indices_dict,cats_d,keep_tagged,vocab = None): #yields (filename, row, tagged_text, error) for each document in a CoNLL-U file (see write_corpus_results())
+	doc_name = conllu_filename
+	try:
+		for doc_id, doc in conllu_docs(conllu_filename,vocab):
+			doc_name = conllu_doc_name(conllu_filename,doc_id)
+			tag_output = LGR_Doc_Analysis(doc,indices_dict,cats_d,keep_tagged)
+			yield((doc_name,results_row(doc_name.split("/")[-1],tag_output,indices_dict),tag_output["tagged_text"],None))
+	except Exception as e: #the rest of the file is skipped
+		yield((doc_name,None,None,repr(e)))
+
+def conllu_worker(task): #tags one CoNLL-U file for LGR_Conllu()
+	conllu_filename, indices_dict, cats_d, keep_tagged = task
+	return(list(conllu_results(conllu_filename,indices_dict,cats_d,keep_tagged)))
+
+def LGR_Conllu(filenames,outname,indices_dict=index_list,cats_d = cats,outdirname = "",output = None,jobs = 1):
+	"""Tag pre-parsed CoNLL-U files (see conllu_docs()) and write LGR_Full()-style output (one row per document). The spacy model is not loaded.
+	With jobs > 1, files are tagged in worker processes (one file per task; rows are still written in the original order).
+	Returns a list of (filename, error) tuples for documents that could not be tagged.
+	"""
+	if jobs > 1:
+		pool = multiprocessing.Pool(jobs)
+		file_results = pool.imap(conllu_worker,((filename,indices_dict,cats_d,output != None) for filename in filenames))
+	else: #documents are read and tagged one at a time
+		pool = None
+		vocab = parsed_vocab()
+		file_results = (conllu_results(filename,indices_dict,cats_d,output != None,vocab) for filename in filenames)
+	try:
+		return(write_corpus_results((result for file_result in file_results for result in file_result),outname,indices_dict,outdirname,output))
+	finally:
+		if pool != None:
+			pool.terminate()
+
 ##############################################################################################################
 ### need to add a function for counting tags from fix-tagged files [xml first, then possibly vert as well] ###
 ##############################################################################################################
 
 ### USED IN Kyle et al 2021, 2022 ###
-def LGR_XML(xml_files,outname,index_list,cats): #for processing TMLE xml texts
+def LGR_XML(xml_files,outname,index_list,cats,batch_size = None): #for processing TMLE xml texts
 	outf = open(outname,"w")#create output file
 	ignore_list = "np np_deps relcl_dep amod_dep det_dep prep_dep poss_dep cc_dep all_clauses finite_clause finite_ind_clause finite_dep_clause finite_compl_clause finite_relative_clause nonfinite_clause vp_deps".split(" ")
 	
@@ -1037,38 +2855,40 @@ def LGR_XML(xml_files,outname,index_list,cats): #for processing TMLE xml texts
 		cleaned = cleaned.replace(" ","_")
 		return(cleaned)
 		
-	for filename in xml_files:
-		simple_fname = filename.split("/")[-1] #grab the filename without all preceding folders
-		print(simple_fname)
-		#if simple_fname in ["socpooh___n149.xml","10206_9-30-2019_19-11-38.xml","10200_9-25-2019_13-51-02.xml","10062_10-24-2018_10-42-32.xml","HarvardX_QMB1_06-28-2020_00-00-38.xml","HarvardX_QMB1_06-28-2020_00-00-39.xml","DartmouthX_RFundX_12-18-2020_00-00-26.xml","HarvardX_QMB1_06-28-2020_00-00-62.xml","HarvardX_QMB1_06-28-2020_00-00-63.xml","10052_10-29-2018_9-15-50.xml","HarvardX_QMB1_06-28-2020_00-00-61.xml","10150_2-26-2019_7-15-00.xml","10109_3-2-2019_8-42-04.xml","MichiganX_ArtsAdminx_02-19-2021_00-00-19_02.xml"]:#skipe these for now - need to update other code and/ or check files
-			#continue
-		tree = ET.parse(filename)
-		root = tree.getroot()
-		if "learning_environment" not in root[0].attrib:
-			le = "tmle"
-		else: le = "traditional"
+	def texts(): #yields (text, output_list) for each file that should be analyzed
+		for filename in xml_files:
+			simple_fname = filename.split("/")[-1] #grab the filename without all preceding folders
+			print(simple_fname)
+			#if simple_fname in ["socpooh___n149.xml","10206_9-30-2019_19-11-38.xml","10200_9-25-2019_13-51-02.xml","10062_10-24-2018_10-42-32.xml","HarvardX_QMB1_06-28-2020_00-00-38.xml","HarvardX_QMB1_06-28-2020_00-00-39.xml","DartmouthX_RFundX_12-18-2020_00-00-26.xml","HarvardX_QMB1_06-28-2020_00-00-62.xml","HarvardX_QMB1_06-28-2020_00-00-63.xml","10052_10-29-2018_9-15-50.xml","HarvardX_QMB1_06-28-2020_00-00-61.xml","10150_2-26-2019_7-15-00.xml","10109_3-2-2019_8-42-04.xml","MichiganX_ArtsAdminx_02-19-2021_00-00-19_02.xml"]:#skipe these for now - need to update other code and/ or check files
+				#continue
+			tree = ET.parse(filename)
+			root = tree.getroot()
+			if "learning_environment" not in root[0].attrib:
+				le = "tmle"
+			else: le = "traditional"
 		
-		if le != "traditional":
-			if root[0].attrib["provided_by"] == "student":
-				continue
-		if "subdiscipline" not in root[0].attrib:
-			if "subject" in root[0].attrib:
-				sdp = cleaner(root[0].attrib["subject"])
-			else: sdp = "n/a" #this is because some files don't have a subject - this is a problem
-		else: sdp = cleaner(root[0].attrib["subdiscipline"])
-		pre_tt = "\t".join([le,root[0].attrib["mode"],cleaner(root[0].attrib["file_type"])])
-		output_list = [simple_fname,le,root[0].attrib["mode"],discipline_fixer(root[0].attrib["discipline"]),sdp,tt_dict[pre_tt]] #start list for indices
+			if le != "traditional":
+				if root[0].attrib["provided_by"] == "student":
+					continue
+			if "subdiscipline" not in root[0].attrib:
+				if "subject" in root[0].attrib:
+					sdp = cleaner(root[0].attrib["subject"])
+				else: sdp = "n/a" #this is because some files don't have a subject - this is a problem
+			else: sdp = cleaner(root[0].attrib["subdiscipline"])
+			pre_tt = "\t".join([le,root[0].attrib["mode"],cleaner(root[0].attrib["file_type"])])
+			output_list = [simple_fname,le,root[0].attrib["mode"],discipline_fixer(root[0].attrib["discipline"]),sdp,tt_dict[pre_tt]] #start list for indices
 		
-		if root[1].attrib["text_type"] in ["plain_text","plaintext"]:
-			text = root[1].text
-		else:
-			if len(root) < 3: #this is due to a problem. Some texts have some issue
-				print(simple_fname + "\ttext tag problem")
-				continue
+			if root[1].attrib["text_type"] in ["plain_text","plaintext"]:
+				text = root[1].text
 			else:
-				text = root[2].text
-		
-		output = LGR_Analysis(text,index_list,cats)
+				if len(root) < 3: #this is due to a problem. Some texts have some issue
+					print(simple_fname + "\ttext tag problem")
+					continue
+				else:
+					text = root[2].text
+			yield((text,output_list))
+
+	for output, output_list in LGR_Batch(texts(),index_list,cats,batch_size = batch_size,as_tuples = True,output = False):
 		no_norming = "nwords wrd_length mattr mean_nominal_deps relcl_nominal amod_nominal det_nominal prep_nominal poss_nominal cc_nominal mean_verbal_deps mlc mltu dc_c ccomp_c relcl_c infinitive_prop nonfinite_prop".split(" ")
 		for x in refined_index_list:
 			if x in no_norming:
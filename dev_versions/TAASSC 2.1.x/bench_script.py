@@ -0,0 +1,120 @@
+import TAASSC_215_dev as lgr
+import gc
+from lexical_diversity import lex_div as ld
+import glob
+import os
+import re
+import time
+
+### Benchmarks for parts of the tagger that do not need the spacy model ###
+
+#reference version: the original nominalization cascade from noun_analysis() (before the suffix trie)
+def nominalization_cascade(text,lemma_lower,pos):
+	two_l = ["al","cy","ee","er","or","ry"]
+	three_l = ["ant","ent","dom","ing","ity","ure","age","ese","ess","ful","ism","ist","ite","let","als","ees","ers","ors","ate"]
+	four_l = ["ance","ence","ment","ness","tion","ship","ette","hood","cies","ries","ants","ents","doms","ings","ages","fuls","isms","ists","ites","lets","eses","ates"]
+	five_l = ["ician","ities","ances","ences","ments","tions","ships","esses","ettes","hoods"]
+	six_l = ["nesses"]
+	proper_two = ["an"]
+	proper_three = ["ian","ans"]
+	proper_four = ["ians"]
+
+	if lemma_lower not in lgr.nominal_stop:
+		if len(text) > 7 and text.lower()[-6:] in six_l:
+			return(True)
+		elif len(text) > 6 and text.lower()[-5:] in five_l:
+			return(True)
+		elif len(text) > 5:
+			return(text.lower()[-4:] in four_l or (pos == "PROPN" and text.lower()[-4:] in proper_four))
+		elif len(text) > 4:
+			return(text.lower()[-3:] in three_l or (pos == "PROPN" and text.lower()[-3:] in proper_three))
+		elif len(text) > 3:
+			return(text.lower()[-2:] in two_l or (pos == "PROPN" and text.lower()[-2:] in proper_two))
+	return(False)
+
+#noun-heavy word list: the noun lexicon, the nominalization stop list, and the words in the test files
+words = []
+for line in open("lists_LGR/semantic_class_noun.txt").read().split("\n"):
+	words += line.split("\t")[1:]
+words += lgr.nominal_stop
+for filename in glob.glob("test_files/*.txt"):
+	words += re.findall(r"[A-Za-z]+",open(filename).read())
+tokens = [(word,word.lower(),pos) for word in words for pos in ["NOUN","PROPN"]]
+
+def best_time(function,repeats = 5): #fastest of several runs (in seconds)
+	times = []
+	for x in range(repeats):
+		gc.collect()
+		start = time.time()
+		function()
+		times.append(time.time() - start)
+	return(min(times))
+
+def run_trie(clear_cache = True):
+	if clear_cache == True:
+		lgr.nominal_cache.clear()
+	return([lgr.is_nominalization(text,text.lower(),lemma,pos) for text, lemma, pos in tokens])
+
+reference = [nominalization_cascade(text,lemma,pos) for text, lemma, pos in tokens]
+cascade_time = best_time(lambda: [nominalization_cascade(text,lemma,pos) for text, lemma, pos in tokens])
+trie_time = best_time(run_trie) #empty cache (each word is classified by walking the trie)
+cached_time = best_time(lambda: run_trie(False)) #all words already cached
+
+print("nominalization matcher:",len(tokens),"nouns; same results:",reference == run_trie())
+print("cascade: %.4f seconds" % cascade_time)
+print("suffix trie: %.4f seconds (%.1fx faster)" % (trie_time,cascade_time/trie_time))
+print("suffix trie, cached: %.4f seconds (%.1fx faster)" % (cached_time,cascade_time/cached_time))
+
+#MATTR: lexical_diversity's mattr() on lemma_pos strings vs. the streaming MattrWindow on integer ids
+lemma_pos = [word.lower() + "_" + pos for word, lemma, pos in tokens]
+id_numbers = {}
+lemma_ids = [id_numbers.setdefault(x,len(id_numbers)) for x in lemma_pos]
+def run_window():
+	window = lgr.MattrWindow(50)
+	window.update(lemma_ids)
+	return(window.value())
+
+ld_time = best_time(lambda: ld.mattr(lemma_pos,50))
+window_time = best_time(run_window)
+print("MATTR:",len(lemma_ids),"tokens; same results:",ld.mattr(lemma_pos,50) == run_window())
+print("ld.mattr: %.4f seconds" % ld_time)
+print("MattrWindow: %.4f seconds (%.1fx faster)" % (window_time,ld_time/window_time))
+
+#batch scheduling: batches of batch_size texts (in input order) vs. length-sorted batches under a token budget (see token_batches())
+#mixed-length corpus: short posts (20-100 words) and a few long transcripts (20,000 words), made from the words in the test files
+sample_words = []
+for filename in sorted(glob.glob("test_files/*.txt")):
+	sample_words += open(filename).read().split()
+def sample_text(n_words,start):
+	return(" ".join([sample_words[(start + x) % len(sample_words)] for x in range(n_words)]))
+mixed_texts = [sample_text(20000 if x % 50 == 0 else 20 + (x * 37) % 81,x * 50) for x in range(200)]
+estimates = [lgr.token_estimate(text) for text in mixed_texts]
+def padded_tokens(batches): #tokens that are processed if each text is padded to the longest text in its batch
+	return(sum([max([estimates[x] for x in batch]) * len(batch) for batch in batches]))
+
+input_order = list(lgr.text_groups(range(len(mixed_texts)),8))
+scheduled = lgr.token_batches(mixed_texts,20000)
+print("batch scheduling:",len(mixed_texts),"texts,",sum(estimates),"tokens")
+print("batch_size = 8: %d batches, %d padded tokens (%.1f%% padding)" % (len(input_order),padded_tokens(input_order),100 - 100.0 * sum(estimates)/padded_tokens(input_order)))
+print("token_budget = 20000: %d batches, %d padded tokens (%.1f%% padding)" % (len(scheduled),padded_tokens(scheduled),100 - 100.0 * sum(estimates)/padded_tokens(scheduled)))
+if "TAASSC_MODEL" in os.environ: #e.g., TAASSC_MODEL=en_core_web_sm to compare schedules with a smaller model
+	lgr.configure_nlp(model = os.environ["TAASSC_MODEL"])
+try: #parsing speed (only if the spaCy model is installed; see configure_nlp())
+	lgr.load_nlp()
+except OSError:
+	print("parsing: skipped (the spaCy model",lgr.nlp_config["model"],"is not installed)")
+else:
+	for label, batches in [("batch_size = 8",input_order),("token_budget = 20000",scheduled)]: #nlp.pipe() only (no tagging)
+		n_tokens = 0
+		start = time.time()
+		for batch in batches:
+			for doc in lgr.load_nlp().pipe([mixed_texts[x] for x in batch],batch_size = len(batch)):
+				n_tokens += len(doc)
+		seconds = time.time() - start
+		print("nlp.pipe() with %s: %.1f seconds (%.0f spacy tokens/second)" % (label,seconds,n_tokens/seconds))
+	for label, settings in [("batch_size = 8",{"batch_size" : 8}),("token_budget = 20000",{"token_budget" : 20000})]:
+		start = time.time()
+		for result in lgr.LGR_Safe_Batch(((text,n) for n, text in enumerate(mixed_texts)),output = False,**settings):
+			pass
+		seconds = time.time() - start
+		print("parsing with %s: %.1f seconds (%.0f tokens/second)" % (label,seconds,sum(estimates)/seconds))